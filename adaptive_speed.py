@@ -0,0 +1,104 @@
+import os
+import re
+
+import speed_meter
+import speed_results
+
+# 自适应测速: 以上一轮 speed_ip.txt 第 50 名的速度为门槛
+# - 估计值明显低于门槛时提前中止 (越测越有把握, 容差随时间收紧)
+# - 估计值已收敛时提前结束, 不必下完整个文件
+# - 只有接近门槛、还没收敛的 IP 才继续读到最后一档
+# 实际只发一个 bytes=SIZES[-1] 的请求, 各档位是同一条流上的检查点, 升档不必重新握手和慢启动
+# 最后一档与固定模式相同 (10MB), 所以每个 IP 读的字节数不会超过固定模式; 没有门槛 (首轮或上轮不足 50 条) 时只靠收敛提前结束
+SIZES = [5 * 1048576, 10 * 1048576]
+TOP_N = 50
+NEAR_BAND = float(os.environ.get('SPEED_NEAR_BAND', 0.15))  # 与门槛相差 15% 以内视为竞争者
+TOLERANCE = float(os.environ.get('SPEED_TOLERANCE', 0.05))  # 最近几个窗口速率相差 5% 以内视为收敛
+WINDOW_SECONDS = 0.2
+CONVERGE_WINDOWS = 3
+MIN_DECISION_SECONDS = 0.5  # 一级下载持续不到这么久时, 估计值不足以判断远离门槛
+MIN_MARGIN = 0.1
+
+
+def load_cutoff(path='speed_ip.txt', rank=None):
+    """上一轮结果中第 rank 名 (默认 TOP_N) 的速度; 文件不存在或不足 rank 条时返回 0 (不做提前中止)
+
+    优先读同名 json, 没有时 (旧版本只写了 txt) 才解析文本
+    """
+    rank = rank or TOP_N
+    speeds = sorted((r.mbps for r in speed_results.load(path)), reverse=True)
+    if speeds:
+        return speeds[rank - 1] if len(speeds) >= rank else 0.0
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            speeds = sorted((float(m.group(1)) for m in (re.search(r'(\d+\.?\d*)MB/s', line) for line in f) if m), reverse=True)
+    except OSError:
+        return 0.0
+    return speeds[rank - 1] if len(speeds) >= rank else 0.0
+
+
+def window_rates(samples, window=WINDOW_SECONDS):
+    """把 [(秒, 累计字节)] 切成固定时长窗口, 返回各窗口 MB/s"""
+    rates = []
+    t0, b0 = samples[0]
+    for t, b in samples[1:]:
+        if t - t0 >= window:
+            rates.append((b - b0) / (t - t0) / 1048576)
+            t0, b0 = t, b
+    return rates
+
+
+class StopRule:
+    """传给 speed_meter.measure 的 should_stop, 结束原因记在 reason ('abort' / 'converged' / 'decided')"""
+
+    def __init__(self, cutoff, sizes=SIZES):
+        self.cutoff = cutoff
+        self.sizes = list(sizes)
+        self.stage = 1  # 当前所在档位 (从 1 开始)
+        self.reason = None
+        self.estimate = 0.0
+
+    def __call__(self, result):
+        samples = result['samples']
+        elapsed = samples[-1][0]
+        self.estimate = speed_meter.steady_mbps(samples) or (samples[-1][1] / elapsed / 1048576 if elapsed > 0 else 0.0)
+        rates = window_rates(samples)
+        if len(rates) >= CONVERGE_WINDOWS:
+            recent = rates[-CONVERGE_WINDOWS:]
+            mean = sum(recent) / len(recent)
+            if mean > 0 and max(abs(rate - mean) for rate in recent) <= mean * TOLERANCE:
+                self.reason = 'converged'
+                return True
+        decisive = elapsed >= MIN_DECISION_SECONDS
+        if self.cutoff > 0 and decisive:
+            margin = max(MIN_MARGIN, MIN_DECISION_SECONDS / elapsed)
+            if self.estimate < self.cutoff * (1 - margin):
+                self.reason = 'abort'
+                return True
+        # 读过第一档后, 明显远离门槛的就此结束, 竞争者继续读到更大的档位 (stage 记录读到的档位)
+        # 慢启动只会让估计偏低, 所以明显高于门槛的不必等时长够; 低于门槛的要时长够才算数
+        while self.stage < len(self.sizes) and result['bytes'] >= self.sizes[self.stage - 1]:
+            self.stage += 1
+        if self.cutoff > 0 and result['bytes'] >= self.sizes[0] and (
+                self.estimate > self.cutoff * (1 + NEAR_BAND) or (decisive and self.estimate < self.cutoff * (1 - NEAR_BAND))):
+            self.reason = 'decided'
+            return True
+        return False
+
+
+def measure(ip, port, host, cutoff, max_time=30, connect_timeout=10):
+    """按档位自适应测速, 返回 speed_meter 结果, 另加 reason (结束原因) / stages (到达的档位)
+
+    读满 max_time 仍未读完的慢 IP 按已有样本给出速度 (reason 为 'max-time'), 不记为失败
+    """
+    rule = StopRule(cutoff)
+    result = speed_meter.measure(ip, f'/__down?bytes={SIZES[-1]}', port=port, host=host,
+                                 max_time=max_time, connect_timeout=connect_timeout, should_stop=rule)
+    if result['error'] == 'max-time' and result['bytes'] > 0 and result['elapsed_s'] >= MIN_DECISION_SECONDS:
+        result['error'] = None
+        result['stopped'] = True
+        result['ok'] = True
+        rule.reason = 'max-time'
+    result['reason'] = rule.reason or ('complete' if result['error'] is None else 'error')
+    result['stages'] = rule.stage
+    return result
@@ -1,168 +1,114 @@
-import requests
-import re
 import os
-import time
-import ipaddress
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
+import re
+from source_fetch import fetch_all
+from source_adapters import load_sources
+from geo_labels import CountryCodeLabel, get_country_code
+import fileutil
+import ip_array
+import metrics
 
-# 目标URL列表
-urls = [
-    'https://raw.githubusercontent.com/ymyuuu/IPDB/main/BestCF/bestcfv4.txt',
-    'https://raw.githubusercontent.com/rong2er/IP666/refs/heads/main/Ranking.txt',
-    'https://raw.githubusercontent.com/gslege/CloudflareIP/refs/heads/main/SG.txt',
-    'https://raw.githubusercontent.com/gslege/CloudflareIP/refs/heads/main/JP.txt',
-    'https://raw.githubusercontent.com/gslege/CloudflareIP/refs/heads/main/DE.txt',
-    'https://raw.githubusercontent.com/gslege/CloudflareIP/refs/heads/main/NL.txt'
-    #'https://www.wetest.vip/page/cloudflare/address_v6.html',
-    #'https://www.wetest.vip/page/cloudflare/address_v4.html',
-    #'https://cf.090227.xyz',
-    #'https://api.uouin.com/cloudflare.html',
-    #'https://ipdb.api.030101.xyz/?type=bestcf&country=true',
-    #'https://addressesapi.090227.xyz/CloudFlareYes',
-]
+# 目标源列表见 ip_sources.json: 每个源声明类型 (text / html / json / browser), 停用的源设 "enabled": false
+sources = load_sources()
 
-# 正则表达式用于初步匹配IPV4与IPV6地址(配合ipaddress库二次过滤)
-ipv4_pattern = r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b'
-# 新版IPv6 pattern: 支持压缩格式(如::), 大/小写
-ipv6_pattern = r'(?:(?:[0-9A-Fa-f]{1,4}:){6}(?:[0-9A-Fa-f]{1,4}|(?<=:)[0-9A-Fa-f]{0,4})|(?:[0-9A-Fa-f]{1,4}:){5}(?::[0-9A-Fa-f]{1,4}){1,2}|(?:[0-9A-Fa-f]{1,4}:){4}(?::[0-9A-Fa-f]{1,4}){1,3}|(?:[0-9A-Fa-f]{1,4}:){3}(?::[0-9A-Fa-f]{1,4}){1,4}|(?:[0-9A-Fa-f]{1,4}:){2}(?::[0-9A-Fa-f]{1,4}){1,5}|(?:[0-9A-Fa-f]{1,4}:){1}(?::[0-9A-Fa-f]{1,4}){1,6}|(?::(?::[0-9A-Fa-f]{1,4}){1,7}|:)|(?:[0-9A-Fa-f]{1,4}:)(?::[0-9A-Fa-f]{1,4}){0,6})'
+# 增量更新: 上一轮文件里已有国家代码的地址直接沿用, 只解析新增的 (及上轮没解析出来的 ZZ), 消失的地址自然不再写出
+# AUTOIP_INCREMENTAL=0 时全部重新解析
+INCREMENTAL = os.environ.get('AUTOIP_INCREMENTAL', '1') == '1'
+# 上一轮输出的行格式: IP:8443#US 或 [IPv6]:8443#US-IPV6
+PREVIOUS_LINE = re.compile(r'^(?:\[([0-9A-Fa-f:.]+)\]|([\d.]+)):\d+#([A-Z]{2})')
+
+def load_previous(path, previous):
+    """读上一轮的输出文件, 地址并入 previous (IPv4Array / IPv6Array), 返回 {打包后的地址: 国家代码} 索引"""
+    index = {}
+    if not os.path.exists(path):
+        return index
+    ips = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = PREVIOUS_LINE.match(line.strip())
+            if not match:
+                continue
+            ip = match.group(1) or match.group(2)
+            try:
+                key = previous.pack(ip)
+            except OSError:
+                continue
+            ips.append(ip)
+            if match.group(3) != 'ZZ':  # 上轮解析失败的下轮重查
+                index[key] = match.group(3)
+    previous.update(ips)
+    return index
 
-# 检查ip.txt和ipv6.txt文件是否存在,如果存在则删除它
-if os.path.exists('ip.txt'):
-    os.remove('ip.txt')
-if os.path.exists('ipv6.txt'):
-    os.remove('ipv6.txt')
+def write_lines(path, lines):
+    """每行一条, 原子写, 速度测试等读方不会读到写了一半的文件"""
+    fileutil.write_atomic(path, ''.join(line + '\n' for line in lines))
 
-# 使用集合存储IP地址实现自动去重
-unique_ipv4 = set()
-unique_ipv6 = set()
+# 分阶段计时, 结束时写出 autoip6_metrics.json / .prom
+metrics.start_phase('load_previous')
 
-def setup_selenium():
-    # 设置无头Chrome浏览器
-    chrome_options = 选项()
-    chrome_options.add_argument("--headless")  # 无头模式,适合Actions
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    return driver
+# 上一轮的地址用于对比增减, 国家代码作为增量索引; 旧文件保留到新文件原子替换为止
+previous_ipv4 = ip_array.IPv4Array()
+previous_ipv6 = ip_array.IPv6Array()
+index_v4 = load_previous('ip.txt', previous_ipv4)
+index_v6 = load_previous('ipv6.txt', previous_ipv6)
+if not INCREMENTAL:
+    index_v4, index_v6 = {}, {}
 
-for url in urls:
-    try:
-        if url == 'https://ip.164746.xyz':  # 针对动态站点用Selenium
-            print(f'Using Selenium for dynamic site: {url}')
-            driver = setup_selenium()
-            driver.get(url)
-            # 等待动态加载(调整时间或加按钮点击)
-            time.sleep(10)  # 等待JS加载IP
-            html_content = driver.page_source
-            driver.quit()
-        else:  # 其他URL用requests(添加no-cache headers)
-            # 随机化URL避免缓存(可选,针对频繁更新站点)
-            if 'wetest.vip' in url:
-                url_with_cache_bust = f"{url}?t={int(time.time())}"
-            else:
-                url_with_cache_bust = url
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Cache-Control': 'no-cache',
-                'Pragma': 'no-cache',
-                'If-None-Match': ''  # 清ETag缓存
-            }
-            response = requests.get(url_with_cache_bust, headers=headers, timeout=7)
-            if response.status_code == 200:
-                html_content = response.text
-                # 调试: 打印响应头,检查缓存状态
-                print(f'{url} Cache-Control header: {response.headers.get("Cache-Control", "none")}')
-            else:
-                print(f'Request failed for {url}: status {response.status_code}')
-                continue
+# 使用紧凑数组存储IP地址(uint32 / 2×uint64), 排序时自动去重
+unique_ipv4 = ip_array.IPv4Array()
+unique_ipv6 = ip_array.IPv6Array()
 
-        # 确保内容获取(对Selenium也检查)
-        if 'html_content' in locals() and len(html_content) > 100:  # 过滤空内容
-            # 使用正则表达式查找IP地址
-            ipv4_matches = re.findall(ipv4_pattern, html_content)
-            ipv6_matches = re.findall(ipv6_pattern, html_content)
-            
-            # 用ipaddress校验并去重
-            valid_ipv4 = []
-            for ip in ipv4_matches:
-                try:
-                    ipaddress.IPv4Address(ip)
-                    unique_ipv4.add(ip)
-                    valid_ipv4.append(ip)
-                except ValueError:
-                    continue
-            valid_ipv6 = []
-            for ip in ipv6_matches:
-                try:
-                    ipaddress.IPv6Address(ip)
-                    unique_ipv6.add(ip.lower())
-                    valid_ipv6.append(ip)
-                except ValueError:
-                    continue
-            print(f'From {url} extracted: {len(ipv4_matches)} IPv4 candidates, {len(ipv6_matches)} IPv6 candidates (valid: {len(valid_ipv4)} IPv4, {len(valid_ipv6)} IPv6)')
-            # 针对wetest.vip, 提取更新时间戳调试
-            if 'wetest.vip' in url:
-                timestamp_pattern = r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})'
-                timestamps = re.findall(timestamp_pattern, html_content)
-                if timestamps:
-                    latest_ts = max(timestamps)
-                    print(f'{url} latest update time: {latest_ts} (current time: {time.strftime("%Y-%m-%d %H:%M:%S")})')
-        else:
-            print(f'{url} content empty or too short, skipping')
-    except Exception as e:  # 捕获Selenium/requests错误
-        print(f'Failed to process {url}: {e}')
-        continue
+metrics.start_phase('fetch_sources')
+# 各源按自己的类型解析 (见 source_adapters.py); HTTP 源共用连接池并发下载, 带 ETag/Last-Modified 条件请求, 304 时复用上次解析结果
+fetched = fetch_all(sources)
+for valid_ipv4, valid_ipv6 in fetched.values():
+    unique_ipv4.update(valid_ipv4)
+    unique_ipv6.update(valid_ipv6)
 
 # 调试: 打印最终unique大小
 print(f'Total unique IPv4: {len(unique_ipv4)}, IPv6: {len(unique_ipv6)}')
+metrics.inc('unique_ips', len(unique_ipv4), family=4)
+metrics.inc('unique_ips', len(unique_ipv6), family=6)
+print(f'IPv4 vs last run: +{len(unique_ipv4.difference(previous_ipv4))} -{len(previous_ipv4.difference(unique_ipv4))}, '
+      f'IPv6: +{len(unique_ipv6.difference(previous_ipv6))} -{len(previous_ipv6.difference(unique_ipv6))}')
+top_prefixes = sorted(unique_ipv4.group_by_prefix(16).items(), key=lambda item: item[1], reverse=True)[:5]
+print(f'Top IPv4 /16: {top_prefixes}')
+
+# 数组已按数值排序, 写文件前才转回文本
+sorted_ipv4 = unique_ipv4.to_strings()
+sorted_ipv6 = unique_ipv6.to_strings()
+
+# 只有索引里没有的地址需要查国家代码
+pending_v4 = [ip for ip in sorted_ipv4 if unique_ipv4.pack(ip) not in index_v4]
+pending_v6 = [ip for ip in sorted_ipv6 if unique_ipv6.pack(ip) not in index_v6]
+print(f'Country codes reused: IPv4 {len(sorted_ipv4) - len(pending_v4)}, IPv6 {len(sorted_ipv6) - len(pending_v6)}; '
+      f'to resolve: IPv4 {len(pending_v4)}, IPv6 {len(pending_v6)}')
+metrics.inc('country_codes_total', len(sorted_ipv4) + len(sorted_ipv6) - len(pending_v4) - len(pending_v6), source='previous')
+metrics.inc('country_codes_total', len(pending_v4) + len(pending_v6), source='lookup')
 
-# 查询每个IP的country_code
-def get_country_code(ip):
-    try:
-        url = f'https://api.ipinfo.io/lite/{ip}?token=6f75ff6b8f013b'
-        resp = requests.get(url, timeout=5)
-        if resp.status_code == 200:
-            data = resp.json()
-            return data.get('country_code') or data.get('country') or 'ZZ'
-        else:
-            return 'ZZ'
-    except Exception as e:
-        print(f"Failed to query country_code for IP {ip}: {e}")
-        return 'ZZ'
+metrics.start_phase('geo_prefetch')
+# 先用 ip-api.com 批量接口(每次100个)一次性解析, 未解析的再由 get_country_code 逐个限速查询
+CountryCodeLabel.prefetch(pending_v4 + pending_v6)
 
+metrics.start_phase('geo_resolve_write')
 # IPv4处理(即使空也写空文件)
-sorted_ipv4 = sorted(unique_ipv4, key=lambda ip: [int(part) for part in ip.split('.')])
 results_v4 = []
 for ip in sorted_ipv4:
-    country_code = get_country_code(ip)
+    country_code = index_v4.get(unique_ipv4.pack(ip)) or get_country_code(ip)
     results_v4.append(f"{ip}:8443#{country_code}")
-    time.sleep(1)
-with open('ip.txt', 'w', encoding='utf-8') as file:
-    for line in results_v4:
-        file.write(line + '\n')
+write_lines('ip.txt', results_v4)
 print(f'Saved {len(results_v4)} unique IPv4 addresses with country_code to ip.txt.')
 print(f'ip.txt size: {os.path.getsize("ip.txt") if os.path.exists("ip.txt") else 0} bytes')  # 调试大小
 
 # IPv6处理(即使空也写空文件)
-sorted_ipv6 = sorted(unique_ipv6)
 results_v6 = []
 for ip in sorted_ipv6:
-    country_code = get_country_code(ip)
+    country_code = index_v6.get(unique_ipv6.pack(ip)) or get_country_code(ip)
     results_v6.append(f"[{ip}]:8443#{country_code}-IPV6")
-    time.sleep(1)
-with open('ipv6.txt', 'w', encoding='utf-8') as file:
-    for line in results_v6:
-        file.write(line + '\n')
+write_lines('ipv6.txt', results_v6)
 print(f'Saved {len(results_v6)} unique IPv6 addresses with country_code to ipv6.txt.')
 print(f'ipv6.txt size: {os.path.getsize("ipv6.txt") if os.path.exists("ipv6.txt") else 0} bytes')  # 调试大小
 
 # 最终调试: 列出当前目录文件
 print(f'Current directory: {os.getcwd()}')
 print(f'Directory files: {os.listdir(".")}')
+print(f'Run metrics: {metrics.write("autoip6_metrics")}')
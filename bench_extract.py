@@ -0,0 +1,78 @@
+import re
+import sys
+import time
+import random
+import ipaddress
+
+import ip_extract
+
+# 对比 autoip6.py 原先的双正则 + ipaddress 校验 与 ip_extract 单遍提取, 在合成大页面上的吞吐
+# 用法: python bench_extract.py [页面 MB 数, 默认 8]
+LEGACY_IPV4 = re.compile(r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b')
+LEGACY_IPV6 = re.compile(r'(?:(?:[0-9A-Fa-f]{1,4}:){6}(?:[0-9A-Fa-f]{1,4}|(?<=:)[0-9A-Fa-f]{0,4})|(?:[0-9A-Fa-f]{1,4}:){5}(?::[0-9A-Fa-f]{1,4}){1,2}|(?:[0-9A-Fa-f]{1,4}:){4}(?::[0-9A-Fa-f]{1,4}){1,3}|(?:[0-9A-Fa-f]{1,4}:){3}(?::[0-9A-Fa-f]{1,4}){1,4}|(?:[0-9A-Fa-f]{1,4}:){2}(?::[0-9A-Fa-f]{1,4}){1,5}|(?:[0-9A-Fa-f]{1,4}:){1}(?::[0-9A-Fa-f]{1,4}){1,6}|(?::(?::[0-9A-Fa-f]{1,4}){1,7}|:)|(?:[0-9A-Fa-f]{1,4}:)(?::[0-9A-Fa-f]{1,4}){0,6})')
+
+
+def legacy_extract(text):
+    """autoip6.py 原实现: 两遍 findall, 每个命中再构造 ipaddress 对象校验"""
+    ipv4, ipv6 = [], []
+    for ip in LEGACY_IPV4.findall(text):
+        try:
+            ipaddress.IPv4Address(ip)
+            ipv4.append(ip)
+        except ValueError:
+            continue
+    for ip in LEGACY_IPV6.findall(text):
+        try:
+            ipaddress.IPv6Address(ip)
+            ipv6.append(ip.lower())
+        except ValueError:
+            continue
+    return ipv4, ipv6
+
+
+def synthetic_page(size_mb, rng):
+    """生成类似 IP 列表网页的文本: 表格行里混着 IPv4/IPv6、端口、时间、延迟和无关文字"""
+    rows = []
+    total = 0
+    while total < size_mb * 1048576:
+        kind = rng.random()
+        if kind < 0.45:
+            ip = f'{rng.choice([104, 172, 162, 198])}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}'
+            row = f'<tr><td>{ip}</td><td>{rng.randint(20, 300)}ms</td><td>2025-11-13 15:{rng.randint(10, 59)}:{rng.randint(10, 59)}</td></tr>\n'
+        elif kind < 0.6:
+            ip = str(ipaddress.IPv6Address((0x26064700 << 96) | rng.getrandbits(64)))
+            row = f'<tr><td>[{ip}]:8443</td><td>{rng.choice(["SJC", "LAX", "HKG"])}</td></tr>\n'
+        elif kind < 0.7:
+            row = f'版本 1.{rng.randint(0, 9)}.{rng.randint(0, 99)} 更新于 12:{rng.randint(10, 59)}:{rng.randint(10, 59)}, 数值 999.1.2.3 无效\n'
+        else:
+            row = '<div class="desc">Cloudflare 优选 IP 列表, 每小时更新, 速度仅供参考 lorem ipsum dolor sit amet</div>\n'
+        rows.append(row)
+        total += len(row)
+    return ''.join(rows)
+
+
+def bench(name, func, text, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ipv4, ipv6 = func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    count = len(ipv4) + len(ipv6)
+    print(f'{name:<12} {best * 1000:8.1f} ms  {count / best:12,.0f} 候选/秒  {len(text) / best / 1048576:7.1f} MB/s  (IPv4 {len(ipv4)}, IPv6 {len(ipv6)})')
+    return ipv4, ipv6
+
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 8
+    text = synthetic_page(size_mb, random.Random(42))
+    print(f'合成页面 {len(text) / 1048576:.1f} MB')
+    legacy = bench('双正则', legacy_extract, text)
+    single = bench('单遍', ip_extract.extract, text)
+    chunks = [text[i:i + 65536] for i in range(0, len(text), 65536)]
+    streamed = bench('单遍(流式)', lambda _: ip_extract.extract_chunks(chunks), text)
+    print(f'结果一致: 整段 {set(single[0]) == set(legacy[0]) and set(single[1]) == set(legacy[1])}, 流式 {streamed == single}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 地理标签层本地基准: 起一个模仿 ip-api.com / ipinfo.io (含 lite) / ipgeolocation.io 响应格式的 HTTP 替身,
+# 每个接口可设延迟、限额 (429)、"未知" 比例和故障 (hang: 挂起到客户端超时, error: 立即返回错误码),
+# 再用 geo_labels 的标签函数解析一批合成 IP, 报告吞吐、单 IP 耗时 p50/p99、每个解析成功的 IP 消耗的上游请求数
+# 每轮在独立子进程和临时目录里跑 (空的 geo_cache, 无离线库), 接口基址通过 GEO_*_URL 环境变量指到替身
+# legacy 模式按改造前的写法逐个 IP 顺序走三个接口 (requests.get, 5s 超时, 无缓存/限速/熔断), 作为对照;
+# 第 2 轮起复用同一临时目录, 即 geo_cache 已预热的情形 (legacy 没有缓存, 各轮一样)
+# 用法: python bench_geo.py [--ips 500] [--labels country_code,city,country] [--modes legacy,per-ip,batch] [--passes 2] [--scenarios healthy,ip-api-down,flaky]
+PROVIDERS = ('ip-api', 'ipinfo', 'ipinfo-lite', 'ipgeolocation')
+ENV_NAMES = {'ip-api': 'GEO_IP_API_URL', 'ipinfo': 'GEO_IPINFO_URL', 'ipinfo-lite': 'GEO_IPINFO_LITE_URL', 'ipgeolocation': 'GEO_IPGEOLOCATION_URL'}
+HANG_SECONDS = 12  # 超过各客户端的请求超时 (单条 5s, 批量 10s)
+
+# 合成真值: (国家代码, 英文国名, 英文城市, 中文国名, 中文城市)
+PLACES = [
+    ('US', 'United States', 'Los Angeles', '美国', '洛杉矶'),
+    ('JP', 'Japan', 'Tokyo', '日本', '东京'),
+    ('SG', 'Singapore', 'Singapore', '新加坡', '新加坡'),
+    ('DE', 'Germany', 'Frankfurt', '德国', '法兰克福'),
+    ('HK', 'Hong Kong', 'Hong Kong', '香港', '香港'),
+    ('GB', 'United Kingdom', 'London', '英国', '伦敦'),
+    ('NL', 'Netherlands', 'Amsterdam', '荷兰', '阿姆斯特丹'),
+    ('KR', 'South Korea', 'Seoul', '韩国', '首尔'),
+]
+
+
+def _provider(**overrides):
+    config = {'latency_ms': 30, 'jitter_ms': 20, 'unknown': 0.02, 'outage': None, 'status': 503, 'quota': None}
+    config.update(overrides)
+    return config
+
+
+SCENARIOS = {
+    'healthy': {name: _provider() for name in PROVIDERS},
+    # 主接口挂起到超时: 考察备用链切换与熔断
+    'ip-api-down': dict({name: _provider() for name in PROVIDERS}, **{'ip-api': _provider(outage='hang')}),
+    # 限额紧 (每 5 秒 60 次) + 大量"未知" + demo key 被拒
+    'flaky': {
+        'ip-api': _provider(quota=(60, 5), unknown=0.2),
+        'ipinfo': _provider(latency_ms=80, jitter_ms=60),
+        'ipinfo-lite': _provider(unknown=0.1),
+        'ipgeolocation': _provider(outage='error', status=401),
+    },
+}
+
+
+def place(ip):
+    """IP 的合成真值, 由哈希固定"""
+    return PLACES[hashlib.sha1(ip.encode()).digest()[0] % len(PLACES)]
+
+
+def expected_label(label_name, ip):
+    country_code, _, _, cn_country, cn_city = place(ip)
+    return {'country_code': country_code, 'country': cn_country, 'city': cn_city}[label_name]
+
+
+def synthetic_ips(n, seed):
+    rng = random.Random(seed)
+    ips = set()
+    while len(ips) < n:
+        ips.add(f'{rng.choice([104, 162, 172, 188])}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}')
+    return sorted(ips)
+
+
+class GeoStandIn:
+    """按路径前缀 /<提供方>/... 分发的地理接口替身, 统计每个提供方的请求数"""
+
+    def __init__(self, scenario, seed=0):
+        self.scenario = scenario
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {name: 0 for name in PROVIDERS}
+        self.limited = {name: 0 for name in PROVIDERS}
+        self.hung = {name: 0 for name in PROVIDERS}
+        self.windows = {name: (0.0, 0) for name in PROVIDERS}  # (窗口起点, 已用次数)
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stand_in.handle(self, None)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stand_in.handle(self, body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return {name: f'http://127.0.0.1:{self.server.server_port}/{name}' for name in PROVIDERS}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _admit(self, name, config):
+        """记一次请求, 返回 (是否放行, 剩余额度, 窗口剩余秒数)"""
+        with self.lock:
+            self.calls[name] += 1
+            if not config['quota']:
+                return True, None, None
+            limit, window = config['quota']
+            now = time.monotonic()
+            started, used = self.windows[name]
+            if now - started >= window:
+                started, used = now, 0
+            used += 1
+            self.windows[name] = (started, used)
+            ttl = max(1, int(window - (now - started)) + 1)
+            if used > limit:
+                self.limited[name] += 1
+                return False, 0, ttl
+            return True, limit - used, ttl
+
+    def _unknown(self, config):
+        with self.lock:
+            return self.rng.random() < config['unknown']
+
+    def handle(self, request, body):
+        url = urlparse(request.path)
+        parts = url.path.strip('/').split('/')
+        name = parts[0]
+        config = self.scenario.get(name)
+        if config is None:
+            return self._reply(request, 404, 'text/plain', b'not found')
+        allowed, remaining, ttl = self._admit(name, config)
+        with self.lock:
+            delay = max(0.0, config['latency_ms'] + self.rng.uniform(-1, 1) * config['jitter_ms']) / 1000
+        time.sleep(delay)
+        headers = {}
+        if remaining is not None:
+            headers = {'X-Rl': str(remaining), 'X-Ttl': str(ttl)}
+        if config['outage'] == 'hang':
+            with self.lock:
+                self.hung[name] += 1
+            time.sleep(HANG_SECONDS)
+            return self._reply(request, 504, 'text/plain', b'gateway timeout')
+        if config['outage'] == 'error':
+            return self._reply(request, config['status'], 'application/json', b'{"message": "unavailable"}')
+        if not allowed:
+            headers['Retry-After'] = str(ttl)
+            return self._reply(request, 429, 'text/plain', b'Too Many Requests', headers)
+        query = parse_qs(url.query)
+        if name == 'ip-api' and parts[1:2] == ['batch']:
+            payload = [self._ip_api(ip, config, query) for ip in json.loads(body or b'[]')]
+        elif name == 'ip-api':
+            payload = self._ip_api(parts[2], config, query)
+        elif name == 'ipinfo' and parts[2:3] == ['country']:
+            country = '' if self._unknown(config) else place(parts[1])[0]
+            return self._reply(request, 200, 'text/plain', f'{country}\n'.encode(), headers)
+        elif name == 'ipinfo':
+            unknown = self._unknown(config)
+            country_code, _, city, _, _ = place(parts[1])
+            payload = {'ip': parts[1], 'city': '' if unknown else city, 'country': '' if unknown else country_code}
+        elif name == 'ipinfo-lite':
+            unknown = self._unknown(config)
+            country_code, country, _, _, _ = place(parts[2])
+            payload = {'ip': parts[2], 'country_code': '' if unknown else country_code, 'country': '' if unknown else country}
+        else:
+            ip = query.get('ip', [''])[0]
+            unknown = self._unknown(config)
+            country_code, country, city, _, _ = place(ip)
+            payload = {'ip': ip, 'country_code2': '' if unknown else country_code, 'country_name': '' if unknown else country, 'city': '' if unknown else city}
+        self._reply(request, 200, 'application/json', json.dumps(payload, ensure_ascii=False).encode(), headers)
+
+    def _ip_api(self, ip, config, query):
+        if self._unknown(config):
+            return {'status': 'fail', 'message': 'reserved range', 'query': ip}
+        country_code, country, city, _, cn_city = place(ip)
+        chinese = query.get('lang', [''])[0] == 'zh-CN'
+        return {'status': 'success', 'country': country, 'countryCode': country_code, 'city': cn_city if chinese else city, 'query': ip}
+
+    @staticmethod
+    def _reply(request, status, content_type, data, headers=None):
+        try:
+            request.send_response(status)
+            request.send_header('Content-Type', content_type)
+            request.send_header('Content-Length', str(len(data)))
+            for key, value in (headers or {}).items():
+                request.send_header(key, value)
+            request.end_headers()
+            request.wfile.write(data)
+        except OSError:
+            pass  # 客户端已超时断开
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def _legacy_ok(get, url):
+    """改造前的单次请求: 直接 requests.get, 5s 超时, 异常与非 200 都算失败"""
+    try:
+        response = get(url, timeout=5)
+        return response if response.status_code == 200 else None
+    except Exception:
+        return None
+
+
+def legacy_resolver(label_name):
+    """改造前 test_speed.py / 国家查询test_speed.py / autoip6.py 的查询链, 接口基址同样指到替身"""
+    import requests
+    import geo_batch
+    import geo_labels
+    endpoints = geo_batch.ENDPOINTS
+
+    def ip_api(ip, fields, lang=''):
+        response = _legacy_ok(requests.get, f"{endpoints['ip-api']}/json/{ip}?fields={fields}{lang}")
+        try:
+            data = response.json() if response else {}
+        except ValueError:
+            data = {}
+        return data if data.get('status') == 'success' else None
+
+    def city(ip):
+        data = ip_api(ip, 'status,city', '&lang=zh-CN')
+        if data and data.get('city', '未知') != '未知':
+            return data['city']
+        response = _legacy_ok(requests.get, f"{endpoints['ipgeolocation']}/ipgeo?apiKey=demo&ip={ip}&fields=city")
+        if response:
+            return geo_labels.translate_city(response.json().get('city', '未知'))
+        response = _legacy_ok(requests.get, f"{endpoints['ipinfo']}/{ip}/json?lang=zh")
+        return geo_labels.translate_city(response.json().get('city', '未知')) if response else '未知'
+
+    def country(ip):
+        data = ip_api(ip, 'status,country,countryCode')
+        en_country = data and (data.get('countryCode') or data.get('country', 'Unknown'))
+        if en_country and en_country != 'Unknown':
+            return geo_labels.EN_TO_CN.get(en_country, en_country)
+        response = _legacy_ok(requests.get, f"{endpoints['ipinfo']}/{ip}/country")
+        en_country = response.text.strip() if response else None
+        if en_country and en_country != 'Unknown':
+            return geo_labels.EN_TO_CN.get(en_country, en_country)
+        response = _legacy_ok(requests.get, f"{endpoints['ipgeolocation']}/ipgeo?apiKey=demo&ip={ip}&fields=country_code,country_name")
+        if response:
+            data = response.json()
+            en_country = data.get('country_code') or data.get('country_name', 'Unknown')
+            if en_country != 'Unknown':
+                return geo_labels.EN_TO_CN.get(en_country, en_country)
+        return '未知'
+
+    def country_code(ip):
+        response = _legacy_ok(requests.get, f"{endpoints['ipinfo-lite']}/lite/{ip}?token=6f75ff6b8f013b")
+        if response:
+            data = response.json()
+            return data.get('country_code') or data.get('country') or 'ZZ'
+        return 'ZZ'
+
+    return {'city': city, 'country': country, 'country_code': country_code}[label_name]
+
+
+def worker(label_name, mode, count, seed, limit_scale):
+    """子进程内执行: 解析合成 IP, 最后一行输出 RESULT {json}"""
+    import geo_batch
+    import geo_cache
+    import geo_labels
+    for bucket in geo_batch.LIMITERS.values():
+        bucket.rate *= limit_scale
+        bucket.capacity *= limit_scale
+        bucket.tokens = bucket.capacity
+    label = geo_labels.LABELS[label_name]
+    resolve = legacy_resolver(label_name) if mode == 'legacy' else label.resolve
+    ips = synthetic_ips(count, seed)
+    start = time.monotonic()
+    prefetch_s = 0.0
+    if mode == 'batch':
+        label.prefetch(ips)
+        prefetch_s = time.monotonic() - start
+    latencies = []
+    correct = resolved = 0
+    for ip in ips:
+        t = time.monotonic()
+        value = resolve(ip)
+        latencies.append(time.monotonic() - t)
+        if value and value not in geo_cache.NEGATIVE_VALUES:
+            resolved += 1
+            correct += value == expected_label(label_name, ip)
+    elapsed = time.monotonic() - start
+    print('RESULT ' + json.dumps({
+        'wall_s': elapsed, 'prefetch_s': prefetch_s, 'ips_per_s': count / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000, 'p99_ms': percentile(latencies, 0.99) * 1000,
+        'resolved': resolved, 'accuracy': correct / resolved if resolved else 0.0,
+    }))
+
+
+def _delta(after, before):
+    return {name: after[name] - before[name] for name in after}
+
+
+def run(scenario_name, label_name, mode, args):
+    """同一替身、同一临时目录连跑 args.passes 轮, 每轮一条报告 (cache=cold / warm), 上游请求数按轮分开统计"""
+    stand_in = GeoStandIn(SCENARIOS[scenario_name], args.seed)
+    endpoints = stand_in.start()
+    env = dict(os.environ, **{ENV_NAMES[name]: url for name, url in endpoints.items()})
+    here = os.path.dirname(os.path.abspath(__file__))
+    env['PYTHONPATH'] = here + os.pathsep + env.get('PYTHONPATH', '')
+    reports = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for index in range(args.passes):
+                calls, limited, hung = dict(stand_in.calls), dict(stand_in.limited), dict(stand_in.hung)
+                proc = subprocess.run(
+                    [sys.executable, os.path.join(here, 'bench_geo.py'), '--worker', label_name, mode,
+                     str(args.ips), str(args.seed), str(args.limit_scale)],
+                    cwd=workdir, env=env, capture_output=True, text=True)
+                match = re.search(r'^RESULT (.*)$', proc.stdout, re.M)
+                if not match:
+                    print(f'{scenario_name}/{label_name}/{mode} 运行失败:\n{proc.stdout[-2000:]}{proc.stderr[-2000:]}')
+                    break
+                report = {'scenario': scenario_name, 'label': label_name, 'mode': mode, 'cache': 'warm' if index else 'cold'}
+                report.update(json.loads(match.group(1)))
+                by_provider = _delta(stand_in.calls, calls)
+                total_calls = sum(by_provider.values())
+                report['calls'] = total_calls
+                report['calls_per_ip'] = total_calls / report['resolved'] if report['resolved'] else None
+                report['by_provider'] = ','.join(f'{name}:{n}' for name, n in by_provider.items() if n)
+                report['429'] = sum(_delta(stand_in.limited, limited).values())
+                report['hung'] = sum(_delta(stand_in.hung, hung).values())
+                reports.append(report)
+    finally:
+        stand_in.close()
+    return reports
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        label_name, mode, count, seed, scale = sys.argv[2:7]
+        worker(label_name, mode, int(count), int(seed), float(scale))
+        return
+    parser = argparse.ArgumentParser(description='地理标签层本地替身负载基准')
+    parser.add_argument('--ips', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--labels', default='country_code,city,country', help='geo_labels.LABELS 中的口径')
+    parser.add_argument('--modes', default='legacy,per-ip,batch',
+                        help='legacy: 改造前的顺序备用链; per-ip: 逐个查询; batch: 先批量预解析再逐个取')
+    parser.add_argument('--passes', type=int, default=2, help='每种组合连跑几轮, 第 2 轮起为缓存已预热')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--limit-scale', type=float, default=20, help='客户端令牌桶默认速率的放大倍数, 压缩基准用时')
+    args = parser.parse_args()
+    for scenario_name in args.scenarios.split(','):
+        for label_name in args.labels.split(','):
+            for mode in args.modes.split(','):
+                for report in run(scenario_name, label_name, mode, args):
+                    print(' '.join(f'{k}={v:.2f}' if isinstance(v, float) else f'{k}={v}' for k, v in report.items()))
+                    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+import os
+import re
+import sys
+import ssl
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+
+import fileutil
+import speed_pipeline
+import speed_results
+import adaptive_speed
+import geo_providers
+
+# 本地端到端测速基准: 在回环地址 (127.0.0.x) 上起一个冒充 speed.cloudflare.com 的 HTTPS /__down?bytes=N 服务,
+# 每个地址可设吞吐、延迟、失败率和截断比例, 用 speed_pipeline.main 完整跑一轮, 报告总用时、传输字节和排名准确度
+# 自适应模式分冷启动 (没有上轮结果, 门槛为 0) 与热启动 (按真值预置上轮 speed_ip.json) 各跑一轮,
+# 热启动时门槛名次按地址数缩放 (可用地址的一半), 才能走到提前中止 / 判定结束的路径
+# 用法: python bench_speed.py [--ips 24] [--seed 1] [--modes adaptive,fixed]
+HOST = 'speed.cloudflare.com'
+CHUNK = 65536
+
+
+def make_certificate(directory):
+    """用 openssl 生成自签名证书, 返回 (证书, 私钥) 路径"""
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', f'/CN={HOST}', '-keyout', key, '-out', cert],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+def random_endpoints(n, rng):
+    """生成 n 个回环地址的配置: rate (MB/s), latency_ms, fail (每个连接失败概率), truncate (只发这个比例就断开)"""
+    endpoints = {}
+    for i in range(n):
+        kind = rng.random()
+        config = {'rate': round(rng.uniform(5, 80), 1), 'latency_ms': rng.randint(1, 80), 'fail': 0.0, 'truncate': None}
+        if kind < 0.15:
+            config['fail'] = 1.0  # 不通
+        elif kind < 0.25:
+            config['fail'] = 0.3  # 时好时坏
+        elif kind < 0.35:
+            config['truncate'] = 0.5  # 下载到一半断开
+        endpoints[f'127.0.0.{i + 2}'] = config
+    return endpoints
+
+
+class StandIn:
+    """多地址 HTTPS 测速替身, 所有地址共用同一端口"""
+
+    def __init__(self, endpoints, cert, key, seed=0):
+        self.endpoints = endpoints
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert, key)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+        self.connections = 0
+        self.sockets = []
+        self.port = 0
+
+    def start(self):
+        for ip, config in self.endpoints.items():
+            sock = socket.create_server((ip, self.port))
+            self.port = sock.getsockname()[1]
+            self.sockets.append(sock)
+            threading.Thread(target=self._accept_loop, args=(sock, config), daemon=True).start()
+        return self.port
+
+    def close(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def _accept_loop(self, sock, config):
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn, config), daemon=True).start()
+
+    def _handle(self, conn, config):
+        with self.lock:
+            self.connections += 1
+            failed = self.rng.random() < config['fail']
+        try:
+            with conn:
+                time.sleep(config['latency_ms'] / 1000)
+                if failed:
+                    return  # 直接断开, 客户端握手失败
+                with self.context.wrap_socket(conn, server_side=True) as tls:
+                    request = b''
+                    while b'\r\n\r\n' not in request:
+                        data = tls.recv(4096)
+                        if not data:
+                            return
+                        request += data
+                    match = re.search(rb'bytes=(\d+)', request)
+                    size = int(match.group(1)) if match else 0
+                    time.sleep(config['latency_ms'] / 1000)
+                    tls.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\nContent-Length: %d\r\n\r\n' % size)
+                    limit = int(size * config['truncate']) if config['truncate'] else size
+                    self._send_paced(tls, limit, config['rate'] * 1048576)
+        except (OSError, ssl.SSLError):
+            pass  # 客户端提前中止
+
+    def _send_paced(self, tls, limit, rate):
+        payload = b'\0' * CHUNK
+        start = time.monotonic()
+        sent = 0
+        while sent < limit:
+            n = min(CHUNK, limit - sent)
+            tls.sendall(payload[:n])
+            sent += n
+            with self.lock:
+                self.bytes_sent += n
+            ahead = sent / rate - (time.monotonic() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+class BenchLabel:
+    """固定标签, 不访问地理接口"""
+    kind = 'bench'
+    name = '基准'
+    providers = geo_providers.ProviderManager([])
+
+    @staticmethod
+    def resolve(ip):
+        return '本地'
+
+    @staticmethod
+    def prefetch(ips):
+        return 0
+
+    @staticmethod
+    def flags(ips):
+        return {}
+
+
+def spearman(xs, ys):
+    """秩相关系数 (无并列名次的简化公式)"""
+    n = len(xs)
+    if n < 2:
+        return None
+    rank_x = {v: i for i, v in enumerate(sorted(range(n), key=lambda i: xs[i]))}
+    rank_y = {v: i for i, v in enumerate(sorted(range(n), key=lambda i: ys[i]))}
+    d2 = sum((rank_x[i] - rank_y[i]) ** 2 for i in range(n))
+    return 1 - 6 * d2 / (n * (n * n - 1))
+
+
+def accuracy(endpoints, ranking, k=10):
+    """对照真值: 只有稳定可用且不截断的地址才应上榜, 按配置吞吐排序"""
+    eligible = {ip: c['rate'] for ip, c in endpoints.items() if c['fail'] == 0 and not c['truncate']}
+    truth = sorted(eligible, key=eligible.get, reverse=True)
+    ranked = [ip for ip, _ in ranking]
+    k = min(k, len(truth))
+    good = [(ip, mbps) for ip, mbps in ranking if ip in eligible]
+    return {
+        'ranked': len(ranked),
+        'eligible': len(truth),
+        f'top{k}_overlap': len(set(ranked[:k]) & set(truth[:k])) / k if k else None,
+        'spearman': spearman([eligible[ip] for ip, _ in good], [mbps for _, mbps in good]),
+        'mean_rel_error': sum(abs(mbps - eligible[ip]) / eligible[ip] for ip, mbps in good) / len(good) if good else None,
+        'ineligible_ranked': len(ranked) - len(good),
+    }
+
+
+def seed_previous(endpoints, port):
+    """按真值写上一轮的 speed_ip.json (只含稳定可用的地址), 返回门槛名次"""
+    eligible = [(ip, c['rate']) for ip, c in endpoints.items() if c['fail'] == 0 and not c['truncate']]
+    results = [speed_results.make_result(ip, port, label='本地', mbps=rate, samples=1) for ip, rate in eligible]
+    fileutil.write_atomic('speed_ip.json', speed_results.render_json(speed_results.top_n(results), {}, time.time()))
+    return max(1, len(eligible) // 2)
+
+
+def run_scenario(endpoints, mode, cert, key, workdir, seed, warm=False):
+    """在 workdir 里跑一轮 speed_pipeline.main, 返回报告; warm 时先预置上轮结果"""
+    server = StandIn(endpoints, cert, key, seed)
+    port = server.start()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    top_n = adaptive_speed.TOP_N
+    try:
+        with open('ip.txt', 'w', encoding='utf-8') as f:
+            for ip in endpoints:
+                f.write(f'{ip}:{port}#US\n')
+        if warm:
+            adaptive_speed.TOP_N = seed_previous(endpoints, port)
+        speed_pipeline.ADAPTIVE = mode == 'adaptive'
+        start = time.monotonic()
+        with open('run.log', 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+            speed_pipeline.main(BenchLabel)
+        elapsed = time.monotonic() - start
+        ranking = [(r.ip, r.mbps) for r in speed_results.load('speed_ip.json')]
+    finally:
+        adaptive_speed.TOP_N = top_n
+        os.chdir(cwd)
+        server.close()
+    report = {'mode': mode, 'start': 'warm' if warm else 'cold', 'wall_s': round(elapsed, 2), 'mb_sent': round(server.bytes_sent / 1048576, 1), 'connections': server.connections}
+    report.update(accuracy(endpoints, ranking))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地测速替身端到端基准')
+    parser.add_argument('--ips', type=int, default=24, help='回环地址数 (最多 250)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--modes', default='adaptive,fixed', help='逗号分隔: adaptive (分档自适应) / fixed (固定 10MB)')
+    args = parser.parse_args()
+    endpoints = random_endpoints(min(args.ips, 250), random.Random(args.seed))
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = make_certificate(tmp)
+        for mode in args.modes.split(','):
+            # 固定模式不用门槛, 冷热启动相同, 只跑一轮
+            for warm in ((False, True) if mode == 'adaptive' else (False,)):
+                workdir = os.path.join(tmp, f"{mode}-{'warm' if warm else 'cold'}")
+                os.makedirs(workdir)
+                report = run_scenario(endpoints, mode, cert, key, workdir, args.seed, warm)
+                print(' '.join(f'{name}={value:.3f}' if isinstance(value, float) else f'{name}={value}' for name, value in report.items()))
+                sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import os
+import random
+import ipaddress
+
+# 从 busi.txt 的 Cloudflare /16 网段抽样生成候选 IP, 按 /24、/16 统计收益
+# 抽样用 Thompson 采样 (Beta 分布): 收益高的网段多抽, 没测过的网段保留探索机会, 反复无收益的网段剪枝
+BUSI_FILE = 'busi.txt'
+SAMPLES = int(os.environ.get('BUSI_SAMPLES', 0))  # 每轮生成的候选数, 0 为关闭
+REWARD_SCALE = 100.0  # MB/s 达到此值记满分 1
+DEAD_TRIES_24 = 3  # /24 抽过这么多次都无收益即剪枝
+DEAD_TRIES_16 = 30  # /16 同理
+
+
+def load_prefixes(path=BUSI_FILE):
+    """读取 busi.txt 中的 IPv4 网络基址 (默认 /16, 也接受写明的 CIDR)"""
+    prefixes = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip().strip('[]')
+            if not line or line.startswith('#') or ':' in line:  # IPv6 网段暂不抽样
+                continue
+            try:
+                network = ipaddress.ip_network(line if '/' in line else f'{line}/16', strict=False)
+            except ValueError:
+                print(f"busi.txt 跳过无效行: {line}")
+                continue
+            prefixes.append(network)
+    return prefixes
+
+
+class SubnetBandit:
+    """网段收益统计, 存在测速历史库的 subnets 表里"""
+
+    def __init__(self, conn, rng=None):
+        self.conn = conn
+        self.rng = rng or random.Random()
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS subnets ('
+            ' prefix TEXT PRIMARY KEY, tries INTEGER NOT NULL DEFAULT 0, reward REAL NOT NULL DEFAULT 0)'
+        )
+
+    def _stats(self, prefixes):
+        rows = {}
+        for i in range(0, len(prefixes), 500):
+            chunk = prefixes[i:i + 500]
+            query = f'SELECT prefix, tries, reward FROM subnets WHERE prefix IN ({",".join("?" * len(chunk))})'
+            rows.update({prefix: (tries, reward) for prefix, tries, reward in self.conn.execute(query, chunk)})
+        return rows
+
+    def _draw(self, tries, reward):
+        # Beta(收益 + 1, 无收益次数 + 1) 的一次采样
+        return self.rng.betavariate(reward + 1, tries - reward + 1)
+
+    @staticmethod
+    def _dead(tries, reward, limit):
+        return tries >= limit and reward == 0
+
+    def sample(self, networks, n):
+        """从 networks (/16 列表) 中抽 n 个互不相同的主机地址"""
+        nets16 = {str(net): net for net in networks}
+        stats16 = self._stats(list(nets16))
+        live16 = [key for key in nets16 if not self._dead(*stats16.get(key, (0, 0)), DEAD_TRIES_16)]
+        if not live16:
+            return []
+        subnets24 = {key: [str(sub) for sub in nets16[key].subnets(new_prefix=24)] for key in live16}
+        stats24 = self._stats([sub for subs in subnets24.values() for sub in subs])
+        live24 = {key: [sub for sub in subs if not self._dead(*stats24.get(sub, (0, 0)), DEAD_TRIES_24)] for key, subs in subnets24.items()}
+        live16 = [key for key in live16 if live24[key]]
+        chosen = set()
+        for _ in range(n * 3):  # 限制尝试次数, 防止网段耗尽时死循环
+            if len(chosen) >= n or not live16:
+                break
+            key16 = max(live16, key=lambda key: self._draw(*stats16.get(key, (0, 0))))
+            key24 = max(live24[key16], key=lambda sub: self._draw(*stats24.get(sub, (0, 0))))
+            base = int(ipaddress.ip_network(key24).network_address)
+            chosen.add(str(ipaddress.IPv4Address(base + self.rng.randint(1, 254))))
+        return sorted(chosen, key=lambda ip: int(ipaddress.IPv4Address(ip)))
+
+    def update(self, ip, mbps):
+        """记录一次结果 (mbps <= 0 为无收益), 同时计入所在 /24 和 /16"""
+        reward = min(1.0, max(0.0, mbps) / REWARD_SCALE)
+        for prefix_len in (24, 16):
+            prefix = str(ipaddress.ip_network(f'{ip}/{prefix_len}', strict=False))
+            self.conn.execute(
+                'INSERT INTO subnets (prefix, tries, reward) VALUES (?, 1, ?)'
+                ' ON CONFLICT(prefix) DO UPDATE SET tries = tries + 1, reward = reward + excluded.reward',
+                (prefix, reward)
+            )
@@ -0,0 +1,12 @@
+import os
+
+# 结果 / 状态文件的原子写: 先写同目录临时文件再 os.replace, 读的一方 (Actions 提交、下游工具、下一轮运行) 不会读到写了一半的文件
+
+
+def write_atomic(path, text):
+    """把 text 原样写入 path (不转换换行), 目录不存在时创建"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    os.replace(tmp, path)
@@ -0,0 +1,160 @@
+import os
+import time
+import threading
+
+import requests
+
+import geo_db
+import geo_cache
+import metrics
+
+# 各在线接口的基址, 可用环境变量指向本地替身 (见 bench_geo.py)
+ENDPOINTS = {
+    'ip-api': os.environ.get('GEO_IP_API_URL', 'http://ip-api.com'),
+    'ipinfo': os.environ.get('GEO_IPINFO_URL', 'https://ipinfo.io'),
+    'ipinfo-lite': os.environ.get('GEO_IPINFO_LITE_URL', 'https://api.ipinfo.io'),
+    'ipgeolocation': os.environ.get('GEO_IPGEOLOCATION_URL', 'https://api.ipgeolocation.io'),
+}
+
+# ip-api.com 批量接口: 每次 POST 最多 100 个地址, 免费版每分钟 15 次
+IP_API_BATCH_URL = f"{ENDPOINTS['ip-api']}/batch"
+IP_API_BATCH_SIZE = 100
+
+
+class TokenBucket:
+    """按提供方限速的令牌桶; 根据响应里的限额头 (X-Rl/X-Ttl, 429 Retry-After) 动态调整, 而不是固定 sleep"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """取一个令牌, 不够时阻塞到可用"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def update(self, response):
+        """读取限额响应头; 剩余额度为 0 或 429 时暂停到窗口重置, 否则按剩余额度/剩余时间调整速率"""
+        headers = response.headers
+        with self.lock:
+            now = time.monotonic()
+            if response.status_code == 429:
+                retry_after = headers.get('Retry-After') or headers.get('X-Ttl') or '60'
+                try:
+                    self.blocked_until = now + float(retry_after)
+                except ValueError:
+                    self.blocked_until = now + 60
+                self.tokens = 0
+                return
+            remaining, ttl = headers.get('X-Rl'), headers.get('X-Ttl')
+            if remaining is None or ttl is None:
+                return
+            try:
+                remaining, ttl = int(remaining), max(float(ttl), 1.0)
+            except ValueError:
+                return
+            if remaining <= 0:
+                self.blocked_until = now + ttl
+                self.tokens = 0
+            else:
+                self.tokens = min(self.tokens, remaining)
+                self.rate = remaining / ttl
+
+
+# 各提供方的默认限速, 收到限额头后自动修正
+LIMITERS = {
+    'ip-api': TokenBucket(rate=45 / 60, capacity=45),  # 单条接口 45 次/分钟
+    'ip-api-batch': TokenBucket(rate=15 / 60, capacity=15),  # 批量接口 15 次/分钟
+    'ipinfo': TokenBucket(rate=10, capacity=10),
+    'ipgeolocation': TokenBucket(rate=1, capacity=1),  # demo key
+}
+
+
+def limited_get(provider, url, **kwargs):
+    """经该提供方令牌桶限速后发 GET, 并用响应头更新限速"""
+    limiter = LIMITERS[provider]
+    limiter.acquire()
+    start = time.monotonic()
+    try:
+        response = requests.get(url, **kwargs)
+    except Exception:
+        metrics.inc('geo_requests_total', provider=provider, status='error')
+        raise
+    finally:
+        metrics.observe('geo_request_seconds', time.monotonic() - start, provider=provider)
+    metrics.inc('geo_requests_total', provider=provider, status=response.status_code)
+    limiter.update(response)
+    return response
+
+
+def query_ip_api_batch(ips, fields, lang=None, timeout=10):
+    """批量查询 ip-api.com, 返回 {ip: 结果字典}; 单批失败时跳过该批"""
+    limiter = LIMITERS['ip-api-batch']
+    params = {'fields': fields if 'query' in fields.split(',') else fields + ',query'}
+    if lang:
+        params['lang'] = lang
+    results = {}
+    for i in range(0, len(ips), IP_API_BATCH_SIZE):
+        batch = ips[i:i + IP_API_BATCH_SIZE]
+        limiter.acquire()
+        start = time.monotonic()
+        try:
+            response = requests.post(IP_API_BATCH_URL, params=params, json=batch, timeout=timeout)
+            metrics.inc('geo_requests_total', provider='ip-api-batch', status=response.status_code)
+            metrics.observe('geo_request_seconds', time.monotonic() - start, provider='ip-api-batch')
+            limiter.update(response)
+            if response.status_code != 200:
+                print(f'  ip-api.com 批量查询失败: {response.status_code}')
+                continue
+            for item in response.json():
+                results[item.get('query')] = item
+        except Exception as e:
+            metrics.inc('geo_requests_total', provider='ip-api-batch', status='error')
+            print(f'  ip-api.com 批量查询异常: {e}')
+    return results
+
+
+def prefetch(kind, ips, fields, extract, lang=None, offline=None):
+    """预先批量解析一批 IP 并写入 geo_cache, 之后逐个调用 get_* 时直接命中缓存
+
+    offline(hit) 从离线库结果取标签, 有结果的 IP 不再占用批量额度;
+    extract(data) 从 ip-api.com 结果取标签; 失败或未知的 IP 不写缓存, 留给逐个查询的备用链
+    """
+    missing = []
+    for ip in dict.fromkeys(ips):
+        if geo_cache.get(kind, ip) is not None:
+            continue
+        hit = geo_db.lookup(ip) if offline else None
+        label = offline(hit) if hit else None
+        if label:
+            geo_cache.put(kind, ip, label)
+        else:
+            missing.append(ip)
+    if not missing:
+        return 0
+    start = time.monotonic()
+    resolved = 0
+    for ip, data in query_ip_api_batch(missing, fields, lang).items():
+        if data.get('status') != 'success':
+            continue
+        label = extract(data)
+        if label and label not in geo_cache.NEGATIVE_VALUES:
+            geo_cache.put(kind, ip, label)
+            resolved += 1
+    print(f'批量解析 {len(missing)} 个 IP, 成功 {resolved} 个, 用时 {time.monotonic() - start:.1f}s')
+    return resolved
@@ -0,0 +1,116 @@
+import os
+import time
+import sqlite3
+import functools
+import ipaddress
+import threading
+
+import metrics
+
+# 地理查询持久缓存 (SQLite), 三个脚本共用; 由 Actions cache 跨运行保存
+CACHE_FILE = os.environ.get('GEO_CACHE', os.path.join('.cache', 'geo_cache.sqlite'))
+TTL = float(os.environ.get('GEO_CACHE_TTL', 7 * 86400))  # 正常结果保留 7 天
+NEGATIVE_TTL = float(os.environ.get('GEO_CACHE_NEG_TTL', 6 * 3600))  # '未知'/'ZZ' 只保留 6 小时, 便于尽快重试
+MAX_ENTRIES = int(os.environ.get('GEO_CACHE_MAX', 50000))  # 超出后按最近访问时间淘汰
+# 开启后同一 /24 (IPv6 为 /48) 内的地址共用结果, Cloudflare 任播段内一般一致
+PREFIX_KEYS = os.environ.get('GEO_CACHE_PREFIX', '0') == '1'
+
+NEGATIVE_VALUES = {'未知', 'ZZ', 'Unknown', ''}
+
+_conn = None
+_lock = threading.Lock()
+_puts_since_evict = 0
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(CACHE_FILE) or '.', exist_ok=True)
+        _conn = sqlite3.connect(CACHE_FILE, isolation_level=None, check_same_thread=False)
+        _conn.execute('PRAGMA journal_mode=WAL')
+        _conn.execute('PRAGMA synchronous=NORMAL')
+        _conn.execute(
+            'CREATE TABLE IF NOT EXISTS geo ('
+            ' kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,'
+            ' expires REAL NOT NULL, accessed REAL NOT NULL,'
+            ' PRIMARY KEY (kind, key))'
+        )
+        _conn.execute('CREATE INDEX IF NOT EXISTS geo_accessed ON geo (accessed)')
+        _evict()
+    return _conn
+
+
+def _prefix_key(ip):
+    """IP -> 所在 /24 (IPv6 为 /48) 网段字符串, 非法地址返回 None"""
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    return str(ipaddress.ip_network(f'{ip}/{24 if addr.version == 4 else 48}', strict=False))
+
+
+def _evict():
+    """删除过期条目, 并把总数压到 MAX_ENTRIES 以内 (先淘汰最久未访问的)"""
+    global _puts_since_evict
+    _puts_since_evict = 0
+    _conn.execute('DELETE FROM geo WHERE expires < ?', (time.time(),))
+    _conn.execute(
+        'DELETE FROM geo WHERE rowid IN ('
+        ' SELECT rowid FROM geo ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+        (MAX_ENTRIES,)
+    )
+
+
+def get(kind, ip):
+    """读取缓存; 先查精确 IP, 开启 PREFIX_KEYS 时再查网段; 未命中或已过期返回 None"""
+    keys = [ip]
+    if PREFIX_KEYS:
+        prefix = _prefix_key(ip)
+        if prefix:
+            keys.append(prefix)
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        for key in keys:
+            row = conn.execute('SELECT value FROM geo WHERE kind = ? AND key = ? AND expires >= ?', (kind, key, now)).fetchone()
+            if row:
+                conn.execute('UPDATE geo SET accessed = ? WHERE kind = ? AND key = ?', (now, kind, key))
+                return row[0]
+    return None
+
+
+def put(kind, ip, value):
+    """写入缓存; '未知'/'ZZ' 等负结果使用较短 TTL 且不写网段键"""
+    global _puts_since_evict
+    negative = value in NEGATIVE_VALUES
+    now = time.time()
+    expires = now + (NEGATIVE_TTL if negative else TTL)
+    keys = [ip]
+    if PREFIX_KEYS and not negative:
+        prefix = _prefix_key(ip)
+        if prefix:
+            keys.append(prefix)
+    with _lock:
+        conn = _connect()
+        for key in keys:
+            conn.execute('INSERT OR REPLACE INTO geo (kind, key, value, expires, accessed) VALUES (?, ?, ?, ?, ?)', (kind, key, value, expires, now))
+        _puts_since_evict += 1
+        if _puts_since_evict >= 100:
+            _evict()
+
+
+def cached(kind):
+    """装饰 func(ip) -> 标签: 命中缓存直接返回, 否则调用并写回"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(ip):
+            value = get(kind, ip)
+            if value is not None:
+                metrics.inc('geo_cache_total', kind=kind, result='hit')
+                return value
+            metrics.inc('geo_cache_total', kind=kind, result='miss')
+            value = func(ip)
+            put(kind, ip, value)
+            return value
+        return wrapper
+    return decorator
@@ -0,0 +1,178 @@
+import os
+import io
+import csv
+import sys
+import gzip
+import mmap
+import struct
+import ipaddress
+
+# 本地离线 IP 库: 由区间 CSV (db-ip lite / start,end,country[,city] / cidr,country[,city]) 构建
+# 文件布局: 头部 | 按起始地址排序的定长区间记录 | 标签偏移表 | 标签文本
+# 记录里 IPv4 统一映射为 ::ffff:a.b.c.d, 与 IPv6 共用一张 128 位有序表, 查询时二分
+DB_FILE = os.environ.get('GEO_DB', os.path.join('.cache', 'geo.db'))
+
+MAGIC = b'YXGEO1\n\x00'
+HEADER = struct.Struct('>8sIIQQ')  # magic, 记录数, 标签数, 标签偏移表位置, 标签文本位置
+RECORD = struct.Struct('>16s16sI')  # 起始地址, 结束地址, 标签序号
+LABEL_OFFSET = struct.Struct('>I')
+
+
+def ip_key(ip):
+    """IP 字符串 -> 16 字节大端键, IPv4 映射到 ::ffff:0:0/96"""
+    addr = ipaddress.ip_address(ip)
+    if addr.version == 4:
+        return b'\x00' * 10 + b'\xff\xff' + addr.packed
+    return addr.packed
+
+
+def _parse_row(row):
+    """解析一行 CSV, 返回 (起始键, 结束键, 国家代码, 城市); 表头/无效行返回 None"""
+    try:
+        if '/' in row[0]:
+            network = ipaddress.ip_network(row[0].strip(), strict=False)
+            start, end = ip_key(str(network[0])), ip_key(str(network[-1]))
+            country, city = row[1], row[2] if len(row) > 2 else ''
+        else:
+            start, end = ip_key(row[0].strip()), ip_key(row[1].strip())
+            if len(row) >= 6:  # db-ip city lite: start,end,continent,country,stateprov,city,...
+                country, city = row[3], row[5]
+            else:
+                country, city = row[2], row[3] if len(row) > 3 else ''
+    except (ValueError, IndexError):
+        return None
+    return start, end, country.strip().upper(), city.strip()
+
+
+def build(csv_path, out_path=DB_FILE):
+    """把区间 CSV (可为 .gz) 编译成可 mmap 的二进制库, 返回记录数
+
+    db-ip 等发行版本身按起始地址有序, 记录直接流式写出; 只有遇到乱序输入才整体读入内存排序
+    """
+    opener = gzip.open if csv_path.endswith('.gz') else open
+    labels = {}
+    records_tmp = out_path + '.records'
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    count = 0
+    in_order = True
+    last_start = b''
+    with opener(csv_path, 'rt', encoding='utf-8', newline='') as f, open(records_tmp, 'wb') as out:
+        for row in csv.reader(f):
+            parsed = _parse_row(row) if row else None
+            if not parsed:
+                continue
+            start, end, country, city = parsed
+            index = labels.setdefault(f'{country}\t{city}', len(labels))
+            out.write(RECORD.pack(start, end, index))
+            in_order = in_order and start >= last_start
+            last_start = start
+            count += 1
+    if not in_order:
+        with open(records_tmp, 'rb') as f:
+            data = f.read()
+        records = sorted(RECORD.iter_unpack(data))
+        with open(records_tmp, 'wb') as f:
+            for record in records:
+                f.write(RECORD.pack(*record))
+
+    label_blob = io.BytesIO()
+    label_offsets = []
+    for label in labels:  # dict 保持插入顺序, 与序号一致
+        label_offsets.append(label_blob.tell())
+        label_blob.write(label.encode('utf-8'))
+    label_offsets.append(label_blob.tell())
+
+    offsets_pos = HEADER.size + RECORD.size * count
+    blob_pos = offsets_pos + LABEL_OFFSET.size * len(label_offsets)
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'wb') as f, open(records_tmp, 'rb') as records:
+        f.write(HEADER.pack(MAGIC, count, len(labels), offsets_pos, blob_pos))
+        while True:
+            chunk = records.read(1 << 20)
+            if not chunk:
+                break
+            f.write(chunk)
+        for offset in label_offsets:
+            f.write(LABEL_OFFSET.pack(offset))
+        f.write(label_blob.getvalue())
+    os.remove(records_tmp)
+    os.replace(tmp_path, out_path)
+    return count
+
+
+class GeoDB:
+    """mmap 打开的离线库, 启动时只读头部, 查询为区间二分 + 单个标签解码"""
+
+    def __init__(self, path=DB_FILE):
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.label_count, self._offsets_pos, self._blob_pos = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'{path} 不是 geo_db 格式')
+
+    def _label(self, index):
+        start, = LABEL_OFFSET.unpack_from(self._mm, self._offsets_pos + index * LABEL_OFFSET.size)
+        end, = LABEL_OFFSET.unpack_from(self._mm, self._offsets_pos + (index + 1) * LABEL_OFFSET.size)
+        country, city = self._mm[self._blob_pos + start:self._blob_pos + end].decode('utf-8').split('\t', 1)
+        return country, city
+
+    def lookup(self, ip):
+        """返回 (国家代码, 英文城市), 未命中返回 None"""
+        try:
+            key = ip_key(ip)
+        except ValueError:
+            return None
+        mm = self._mm
+        lo, hi = 0, self.count
+        # 找最后一个起始地址 <= key 的记录
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = HEADER.size + mid * RECORD.size
+            if mm[pos:pos + 16] <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        pos = HEADER.size + (lo - 1) * RECORD.size
+        start, end, index = RECORD.unpack_from(mm, pos)
+        if key > end:
+            return None
+        return self._label(index)
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+_default_db = None
+_default_loaded = False
+
+
+def lookup(ip):
+    """用默认库 (GEO_DB 环境变量或 .cache/geo.db) 查询; 库不存在时始终返回 None, 由调用方回退到在线 API"""
+    global _default_db, _default_loaded
+    if not _default_loaded:
+        _default_loaded = True
+        if os.path.exists(DB_FILE):
+            try:
+                _default_db = GeoDB(DB_FILE)
+            except (OSError, ValueError) as e:
+                print(f'离线库 {DB_FILE} 打开失败: {e}')
+    if _default_db is None:
+        return None
+    return _default_db.lookup(ip)
+
+
+if __name__ == '__main__':
+    # python geo_db.py build dbip-city-lite.csv.gz [.cache/geo.db]
+    # python geo_db.py lookup 104.16.10.6 ...
+    if len(sys.argv) >= 3 and sys.argv[1] == 'build':
+        out = sys.argv[3] if len(sys.argv) > 3 else DB_FILE
+        print(f'已写入 {build(sys.argv[2], out)} 条区间到 {out}')
+    elif len(sys.argv) >= 3 and sys.argv[1] == 'lookup':
+        for ip in sys.argv[2:]:
+            print(ip, lookup(ip))
+    else:
+        print('用法: python geo_db.py build <csv[.gz]> [输出] | lookup <ip> ...')
@@ -0,0 +1,294 @@
+import geo_db
+import geo_cache
+import geo_batch
+import geo_providers
+
+# 测速结果的地理标签: 城市 (test_speed.py) 与国家 (国家查询test_speed.py) 两种口径
+# 每种口径都是 先缓存 → 离线库 → 在线 API 备用链, 并支持批量预解析
+
+# 英文城市 → 中文映射（针对 fallback 英文名）
+EN_CITY_TO_CN = {
+    'San Francisco': '旧金山',
+    'New York': '纽约',
+    'Los Angeles': '洛杉矶',
+    'Chicago': '芝加哥',
+    'Houston': '休斯顿',
+    'Phoenix': '凤凰城',
+    'Philadelphia': '费城',
+    'San Antonio': '圣安东尼奥',
+    'San Diego': '圣迭戈',
+    'Dallas': '达拉斯',
+    'Seattle': '西雅图',
+    'Denver': '丹佛',
+    'Washington': '华盛顿',
+    'Boston': '波士顿',
+    'Detroit': '底特律',
+    'Nashville': '纳什维尔',
+    'Portland': '波特兰',
+    'Las Vegas': '拉斯维加斯',
+    'Memphis': '孟菲斯',
+    'Oklahoma City': '俄克拉荷马城',
+    'Baltimore': '巴尔的摩',
+    'Milwaukee': '密尔沃基',
+    'Albuquerque': '阿尔伯克基',
+    'Tucson': '图森',
+    'Fresno': '弗雷斯诺',
+    'Sacramento': '萨克拉门托',
+    'Long Beach': '长滩',
+    'Kansas City': '堪萨斯城',
+    'Mesa': '梅萨',
+    'Atlanta': '亚特兰大',
+    'Colorado Springs': '科罗拉多斯普林斯',
+    'Virginia Beach': '弗吉尼亚比奇',
+    'Raleigh': '罗利',
+    'Omaha': '奥马哈',
+    'Miami': '迈阿密',
+    'Oakland': '奥克兰',
+    'Minneapolis': '明尼阿波利斯',
+    'Tulsa': '塔尔萨',
+    'Cleveland': '克利夫兰',
+    'Wichita': '威奇托',
+    'Arlington': '阿灵顿',
+    # 加更多如果需要
+    'Unknown': '未知'
+}
+
+def translate_city(en_city):
+    """英文城市转中文"""
+    return EN_CITY_TO_CN.get(en_city, en_city)  # 未匹配返回原英文
+
+def _offline_city(hit):
+    """离线库只有英文城市名: 映射表里有中文名才算命中, 翻译不了的 (如 Toronto) 交给在线接口取中文"""
+    city = EN_CITY_TO_CN.get(hit[1]) if hit and hit[1] else None
+    return _known(city)
+
+
+def _http_json(provider, url):
+    """经限速发请求, 非 200 视为提供方出错"""
+    response = geo_batch.limited_get(provider, url, timeout=5)
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    return response
+
+
+def _known(value):
+    return value if value and value not in geo_cache.NEGATIVE_VALUES else None
+
+
+def _city_ip_api(ip):
+    # ip-api.com (HTTP, lang=zh-CN 直接返回中文)
+    data = _http_json('ip-api', f"{geo_batch.ENDPOINTS['ip-api']}/json/{ip}?fields=status,message,city&lang=zh-CN").json()
+    if data.get('status') != 'success':
+        return None  # status fail 是针对这个 IP 的回答 (如保留地址), 不是接口故障, 不计入熔断
+    return _known(data.get('city'))
+
+
+def _city_ipgeolocation(ip):
+    # ipgeolocation.io (demo key, 英文后翻译)
+    data = _http_json('ipgeolocation', f"{geo_batch.ENDPOINTS['ipgeolocation']}/ipgeo?apiKey=demo&ip={ip}&fields=city").json()
+    city = _known(data.get('city'))
+    return translate_city(city) if city else None
+
+
+def _city_ipinfo(ip):
+    # ipinfo.io (英文后翻译)
+    data = _http_json('ipinfo', f"{geo_batch.ENDPOINTS['ipinfo']}/{ip}/json?lang=zh").json()
+    city = _known(data.get('city'))
+    return translate_city(city) if city else None
+
+
+# 初始顺序同原备用链, 运行中按延迟与有效率自动调整; 只有 ip-api 直接给中文城市名, 其余的英文名常常翻译不了, 所以固定优先
+CITY_PROVIDERS = geo_providers.ProviderManager([
+    geo_providers.Provider('ip-api.com', _city_ip_api, preferred=True),
+    geo_providers.Provider('ipgeolocation.io', _city_ipgeolocation),
+    geo_providers.Provider('ipinfo.io', _city_ipinfo),
+])
+
+
+@geo_cache.cached('city_cn')
+def get_chinese_city(ip):
+    """查询 IP 城市，并返回中文城市名（先查本地离线库；再由 CITY_PROVIDERS 按健康度排序、对冲查询在线接口）"""
+    # 本地离线库 (英文城市名，能翻译成中文才用)
+    hit = geo_db.lookup(ip)
+    cn_city = _offline_city(hit)
+    if cn_city:
+        print(f" 城市: {hit[1]} -> {cn_city} (离线库)")
+        return cn_city
+    cn_city, provider = CITY_PROVIDERS.resolve(ip)
+    if cn_city is None:
+        print(f"  {ip} 城市查询全部失败")
+        return '未知'
+    print(f" 城市: {cn_city} ({provider})")
+    return cn_city
+
+# 国家映射：支持 code (US) 和 full name (United States)
+EN_TO_CN = {
+    # Codes
+    'US': '美国',
+    'CA': '加拿大',
+    'CN': '中国',
+    'GB': '英国',
+    'DE': '德国',
+    'FR': '法国',
+    'JP': '日本',
+    'AU': '澳大利亚',
+    'IN': '印度',
+    'BR': '巴西',
+    'RU': '俄罗斯',
+    'KR': '韩国',
+    'NL': '荷兰',
+    'SG': '新加坡',
+    'HK': '香港',
+    'TW': '台湾',
+    # Full names (fallback)
+    'United States': '美国',
+    'Canada': '加拿大',
+    'China': '中国',
+    'United Kingdom': '英国',
+    'Germany': '德国',
+    'France': '法国',
+    'Japan': '日本',
+    'Australia': '澳大利亚',
+    'India': '印度',
+    'Brazil': '巴西',
+    'Russia': '俄罗斯',
+    'South Korea': '韩国',
+    'Netherlands': '荷兰',
+    'Singapore': '新加坡',
+    'Hong Kong': '香港',
+    'Taiwan': '台湾',
+    'Reserved': '预留',
+    'Global': '全球',
+    'Unknown': '未知'
+}
+
+def _country_ip_api(ip):
+    data = _http_json('ip-api', f"{geo_batch.ENDPOINTS['ip-api']}/json/{ip}?fields=status,message,country,countryCode").json()
+    if data.get('status') != 'success':
+        return None  # 同 _city_ip_api: 按无结果处理
+    return _known(data.get('countryCode') or data.get('country'))  # 优先 code
+
+
+def _country_ipinfo(ip):
+    return _known(_http_json('ipinfo', f"{geo_batch.ENDPOINTS['ipinfo']}/{ip}/country").text.strip())
+
+
+def _country_ipgeolocation(ip):
+    # ipgeolocation.io (demo key)
+    data = _http_json('ipgeolocation', f"{geo_batch.ENDPOINTS['ipgeolocation']}/ipgeo?apiKey=demo&ip={ip}&fields=country_code,country_name").json()
+    return _known(data.get('country_code') or data.get('country_name'))
+
+
+COUNTRY_PROVIDERS = geo_providers.ProviderManager([
+    geo_providers.Provider('ip-api.com', _country_ip_api),
+    geo_providers.Provider('ipinfo.io', _country_ipinfo),
+    geo_providers.Provider('ipgeolocation.io', _country_ipgeolocation),
+])
+
+
+@geo_cache.cached('country_cn')
+def get_chinese_country(ip):
+    """查询 IP 国家，并返回中文名（先查本地离线库；再由 COUNTRY_PROVIDERS 按健康度排序、对冲查询在线接口）"""
+    # 本地离线库 (国家代码)
+    hit = geo_db.lookup(ip)
+    if hit and hit[0]:
+        cn_country = EN_TO_CN.get(hit[0], hit[0])
+        print(f" 国家: {hit[0]} -> {cn_country} (离线库)")
+        return cn_country
+    en_country, provider = COUNTRY_PROVIDERS.resolve(ip)
+    if en_country is None:
+        print(f"  {ip} 国家查询全部失败")
+        return '未知'
+    cn_country = EN_TO_CN.get(en_country, en_country)
+    print(f" 国家: {en_country} -> {cn_country} ({provider})")
+    return cn_country
+
+
+def _country_code_ipinfo_lite(ip):
+    data = _http_json('ipinfo', f"{geo_batch.ENDPOINTS['ipinfo-lite']}/lite/{ip}?token=6f75ff6b8f013b").json()
+    return _known(data.get('country_code') or data.get('country'))
+
+
+COUNTRY_CODE_PROVIDERS = geo_providers.ProviderManager([
+    geo_providers.Provider('ipinfo.io lite', _country_code_ipinfo_lite),
+])
+
+
+@geo_cache.cached('country_code')
+def get_country_code(ip):
+    """查询 IP 的国家代码 (autoip6.py 写 ip.txt 用)，先查本地离线库，未命中再走在线 API，失败返回 ZZ"""
+    hit = geo_db.lookup(ip)
+    if hit and hit[0]:
+        return hit[0]
+    country_code, _ = COUNTRY_CODE_PROVIDERS.resolve(ip)
+    return country_code or 'ZZ'
+
+
+class CityLabel:
+    """中文城市标签"""
+    kind = 'city_cn'
+    name = '城市'
+    providers = CITY_PROVIDERS
+
+    @staticmethod
+    def resolve(ip):
+        return get_chinese_city(ip)
+
+    @staticmethod
+    def prefetch(ips):
+        geo_batch.prefetch('city_cn', ips, 'status,city', lambda data: data.get('city'),
+                           lang='zh-CN', offline=_offline_city)
+
+    @staticmethod
+    def flags(ips):
+        return country_codes(ips)
+
+
+class CountryLabel:
+    """中文国家标签"""
+    kind = 'country_cn'
+    name = '国家'
+    providers = COUNTRY_PROVIDERS
+
+    @staticmethod
+    def resolve(ip):
+        return get_chinese_country(ip)
+
+    @staticmethod
+    def prefetch(ips):
+        geo_batch.prefetch('country_cn', ips, 'status,countryCode', lambda data: EN_TO_CN.get(data.get('countryCode'), data.get('countryCode')),
+                           offline=lambda hit: EN_TO_CN.get(hit[0], hit[0]) if hit[0] else None)
+
+    @staticmethod
+    def flags(ips):
+        return country_codes(ips)
+
+
+class CountryCodeLabel:
+    """两位国家代码 (ip.txt / ipv6.txt 用)"""
+    kind = 'country_code'
+    name = '国家代码'
+    providers = COUNTRY_CODE_PROVIDERS
+
+    @staticmethod
+    def resolve(ip):
+        return get_country_code(ip)
+
+    @staticmethod
+    def prefetch(ips):
+        geo_batch.prefetch('country_code', ips, 'status,countryCode', lambda data: data.get('countryCode'),
+                           offline=lambda hit: hit[0])
+
+    @staticmethod
+    def flags(ips):
+        return country_codes(ips)
+
+
+def country_codes(ips):
+    """结果 md 的国旗用: {ip: 两位国家代码}, 先批量预解析"""
+    ips = list(dict.fromkeys(ips))
+    CountryCodeLabel.prefetch(ips)
+    return {ip: get_country_code(ip) for ip in ips}
+
+
+LABELS = {'city': CityLabel, 'country': CountryLabel, 'country_code': CountryCodeLabel}
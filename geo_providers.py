@@ -0,0 +1,174 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import metrics
+
+# 地理接口备用链的自适应调度: 按各提供方的滚动延迟与成功率动态排序, 连续出错的熔断一段时间,
+# 主请求超过其 p90 延迟仍未返回时向下一个提供方发对冲请求, 先拿到有效结果的为准
+# 单个 IP 的标签耗时因此约等于最快的健康提供方, 而不是各级超时之和
+# 标签质量不同的提供方 (如只有 ip-api 直接返回中文城市名) 可标为 preferred, 未熔断时总排在前面;
+# 其余按期望耗时排, 每 EXPLORE_EVERY 次把最久没被调用的提供方提到前面重新采样, 一次降级不会变成永久降级
+WINDOW = 50  # 滚动统计的最近调用数
+MIN_SAMPLES = 5  # 样本不足时用默认对冲延迟
+DEFAULT_HEDGE_DELAY = 1.0  # 秒
+MIN_HEDGE_DELAY = 0.2
+BREAKER_FAILS = 3  # 连续出错这么多次即熔断
+BREAKER_COOLDOWN = 300  # 熔断秒数, 到期后放行一次试探 (半开)
+EXPLORE_EVERY = 20  # 每这么多次查询探索一次
+
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='geo')
+
+
+class Provider:
+    """一个地理接口; query(ip) 返回标签, 无结果返回 None, 请求出错时抛异常"""
+
+    def __init__(self, name, query, preferred=False):
+        self.name = name
+        self.query = query
+        self.preferred = preferred
+        self.breaker = True  # 单提供方的链上由 ProviderManager 关闭
+        self.last_called = 0.0
+        self.latencies = deque(maxlen=WINDOW)
+        self.outcomes = deque(maxlen=WINDOW)  # True 为拿到有效标签
+        self.consecutive_errors = 0
+        self.open_until = 0.0
+        self.probing = False  # 半开状态下已有试探请求在途
+        self.lock = threading.Lock()
+
+    def p90(self):
+        with self.lock:
+            if len(self.latencies) < MIN_SAMPLES:
+                return DEFAULT_HEDGE_DELAY
+            ordered = sorted(self.latencies)
+        return max(MIN_HEDGE_DELAY, ordered[int(len(ordered) * 0.9) - 1])
+
+    def expected_cost(self):
+        """期望拿到有效结果的耗时: 中位延迟 / 平滑后的成功率, 越小越靠前"""
+        with self.lock:
+            ordered = sorted(self.latencies)
+            median = ordered[len(ordered) // 2] if ordered else DEFAULT_HEDGE_DELAY
+            rate = (sum(self.outcomes) + 1) / (len(self.outcomes) + 2)
+        return median / rate
+
+    def available(self, now):
+        """未熔断, 或冷却已到期且还没有试探请求在途; 不占用半开名额"""
+        with self.lock:
+            return self._closed() or (now >= self.open_until and not self.probing)
+
+    def _closed(self):
+        return not self.breaker or self.consecutive_errors < BREAKER_FAILS
+
+    def admit(self, now):
+        """真正发请求前调用: 熔断中不放行; 冷却到期后只放行一个试探请求 (半开), 由 _record 释放"""
+        with self.lock:
+            if not self._closed():
+                if now < self.open_until or self.probing:
+                    return False
+                self.probing = True
+            self.last_called = now
+            return True
+
+    def call(self, ip):
+        start = time.monotonic()
+        try:
+            label = self.query(ip)
+        except Exception as e:
+            self._record(time.monotonic() - start, None, error=True)
+            metrics.inc('geo_provider_calls_total', provider=self.name, outcome='error')
+            print(f"  {self.name} 查询失败 {ip}: {e}")
+            return None
+        self._record(time.monotonic() - start, label, error=False)
+        metrics.inc('geo_provider_calls_total', provider=self.name, outcome='ok' if label else 'empty')
+        return label
+
+    def _record(self, elapsed, label, error):
+        with self.lock:
+            self.probing = False
+            self.outcomes.append(bool(label))
+            if error:
+                self.consecutive_errors += 1
+                if self.breaker and self.consecutive_errors >= BREAKER_FAILS:
+                    self.open_until = time.monotonic() + BREAKER_COOLDOWN
+                    print(f"  {self.name} 连续出错 {self.consecutive_errors} 次, 熔断 {BREAKER_COOLDOWN}s")
+            else:
+                self.consecutive_errors = 0
+                self.latencies.append(elapsed)
+
+
+class ProviderManager:
+    """按健康度排序并对冲调用一组提供方"""
+
+    def __init__(self, providers):
+        self.providers = list(providers)
+        # 只有一个提供方时熔断没有备用可切, 只会让其余 IP 不发请求就记为失败 (还会进负缓存), 所以不熔断
+        if len(self.providers) == 1:
+            self.providers[0].breaker = False
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def order(self):
+        """可用的提供方: preferred 的在前, 其余按期望耗时升序 (样本相同时保持配置顺序); 定期探索见 EXPLORE_EVERY"""
+        now = time.monotonic()
+        with self.lock:
+            self.calls += 1
+            explore = self.calls % EXPLORE_EVERY == 0
+        ranked = [(not p.preferred, p.expected_cost(), i, p) for i, p in enumerate(self.providers) if p.available(now)]
+        ranked.sort(key=lambda item: item[:3])
+        preferred = [p for *_, p in ranked if p.preferred]
+        others = [p for *_, p in ranked if not p.preferred]
+        if explore and len(others) > 1:
+            # 最久没调用过的排到非 preferred 中的第一位, 慢了也有对冲兜底
+            stale = min(others, key=lambda p: p.last_called)
+            others.remove(stale)
+            others.insert(0, stale)
+        return preferred + others
+
+    def resolve(self, ip):
+        """返回 (标签, 提供方名); 全部失败或无结果返回 (None, None)"""
+        pending = self.order()
+        inflight = {}  # future -> 提供方
+        next_hedge = 0.0  # 最近一次发出的请求超过其 p90 的时刻
+
+        def launch():
+            # 发请求时才占用半开试探名额, 排在后面没轮到的提供方不受影响
+            nonlocal next_hedge
+            while pending:
+                provider = pending.pop(0)
+                if provider.admit(time.monotonic()):
+                    inflight[_executor.submit(provider.call, ip)] = provider
+                    next_hedge = time.monotonic() + provider.p90()
+                    return
+
+        while pending or inflight:
+            if pending and not inflight:
+                launch()
+                if not inflight:
+                    break
+            # 最近发出的请求超过其 p90 仍未返回, 就对冲下一个; 按最近一次计时, 对冲逐个发出而不是一次全发
+            delay = max(0.0, next_hedge - time.monotonic()) if pending else None
+            done, _ = wait(inflight, timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                metrics.inc('geo_hedges_total')
+                launch()
+                continue
+            for future in done:
+                provider = inflight.pop(future)
+                label = future.result()
+                if label:
+                    # 未完成的请求留在后台跑完, 结果仍计入统计
+                    return label, provider.name
+        return None, None
+
+    def stats(self):
+        """各提供方当前统计, 供日志输出"""
+        now = time.monotonic()
+        rows = []
+        for p in self.providers:
+            with p.lock:
+                count = len(p.outcomes)
+                rate = sum(p.outcomes) / count if count else 0.0
+                state = '熔断' if now < p.open_until else '正常'
+            rows.append(f"{p.name}: {count} 次, 有效率 {rate:.0%}, p90 {p.p90():.2f}s, {state}")
+        return '; '.join(rows)
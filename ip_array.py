@@ -0,0 +1,178 @@
+import sys
+import socket
+import struct
+import itertools
+import ipaddress
+from array import array
+
+# 紧凑候选集合: IPv4 存 uint32 数组, IPv6 存两个 uint64 数组 (高/低 64 位)
+# 添加时只追加到数组, 用到时一次性排序去重 (数值序, 非字符串序); 只在写 ip.txt/ipv6.txt 时才转回文本
+_QQ = struct.Struct('>QQ')
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+def _sorted_unique(values):
+    """排序并去掉相邻重复"""
+    return [key for key, _ in itertools.groupby(sorted(values))]
+
+
+class IPv4Array:
+    def __init__(self, values=()):
+        self._values = array('I', values)
+        self._sorted = False
+
+    @staticmethod
+    def pack(ip):
+        return struct.unpack('>I', socket.inet_aton(ip))[0]
+
+    @staticmethod
+    def unpack(value):
+        return socket.inet_ntoa(struct.pack('>I', value))
+
+    def update(self, ips):
+        """追加一批 IP 字符串 (需已校验); 整批拼成大端字节后一次 frombytes"""
+        chunk = array('I')
+        chunk.frombytes(b''.join(map(socket.inet_aton, ips)))
+        if _LITTLE_ENDIAN:
+            chunk.byteswap()
+        self._values.extend(chunk)
+        self._sorted = False
+
+    def _normalize(self):
+        if not self._sorted:
+            self._values = array('I', _sorted_unique(self._values))
+            self._sorted = True
+
+    def __len__(self):
+        self._normalize()
+        return len(self._values)
+
+    def __iter__(self):
+        """按数值升序产出整数"""
+        self._normalize()
+        return iter(self._values)
+
+    def __contains__(self, ip):
+        self._normalize()
+        key = self.pack(ip)
+        lo, hi = 0, len(self._values)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._values[mid] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < len(self._values) and self._values[lo] == key
+
+    def to_strings(self):
+        """按数值升序转回文本"""
+        self._normalize()
+        packed = array('I', self._values)
+        if _LITTLE_ENDIAN:
+            packed.byteswap()
+        data = packed.tobytes()
+        return [socket.inet_ntoa(data[i:i + 4]) for i in range(0, len(data), 4)]
+
+    def difference(self, other):
+        """self - other, 两个有序数组归并求差"""
+        self._normalize()
+        other._normalize()
+        result = type(self)(_merge_difference(self._values, other._values))
+        result._sorted = True
+        return result
+
+    def group_by_prefix(self, prefix_len):
+        """按前缀分组计数, 返回 {'104.16.0.0/16': 数量}, 按网段升序"""
+        shift = 32 - prefix_len
+        groups = {}
+        for prefix, members in itertools.groupby(self, key=lambda value: value >> shift):
+            network = ipaddress.IPv4Network((prefix << shift, prefix_len))
+            groups[str(network)] = sum(1 for _ in members)
+        return groups
+
+
+class IPv6Array:
+    def __init__(self):
+        self._hi = array('Q')
+        self._lo = array('Q')
+        self._sorted = False
+
+    @staticmethod
+    def pack(ip):
+        return _QQ.unpack(socket.inet_pton(socket.AF_INET6, ip))
+
+    @staticmethod
+    def unpack(hi, lo):
+        return str(ipaddress.IPv6Address((hi << 64) | lo))
+
+    def update(self, ips):
+        """追加一批 IP 字符串 (需已校验); 拼成大端字节后按 uint64 解出, 偶数位为高位、奇数位为低位"""
+        chunk = array('Q')
+        chunk.frombytes(b''.join(socket.inet_pton(socket.AF_INET6, ip) for ip in ips))
+        if _LITTLE_ENDIAN:
+            chunk.byteswap()
+        self._hi.extend(chunk[0::2])
+        self._lo.extend(chunk[1::2])
+        self._sorted = False
+
+    def _set_pairs(self, pairs):
+        self._hi = array('Q', (hi for hi, _ in pairs))
+        self._lo = array('Q', (lo for _, lo in pairs))
+        self._sorted = True
+
+    def _normalize(self):
+        if not self._sorted:
+            self._set_pairs(_sorted_unique(zip(self._hi, self._lo)))
+
+    def __len__(self):
+        self._normalize()
+        return len(self._hi)
+
+    def __iter__(self):
+        """按数值升序产出 (高64位, 低64位)"""
+        self._normalize()
+        return zip(self._hi, self._lo)
+
+    def __contains__(self, ip):
+        self._normalize()
+        key = self.pack(ip)
+        lo, hi = 0, len(self._hi)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (self._hi[mid], self._lo[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < len(self._hi) and (self._hi[lo], self._lo[lo]) == key
+
+    def to_strings(self):
+        return [self.unpack(hi, lo) for hi, lo in self]
+
+    def difference(self, other):
+        self._normalize()
+        other._normalize()
+        result = type(self)()
+        result._set_pairs(_merge_difference(list(self), list(other)))
+        return result
+
+    def group_by_prefix(self, prefix_len):
+        """按前缀分组计数 (prefix_len <= 64), 返回 {'2606:4700::/32': 数量}"""
+        shift = 64 - prefix_len
+        groups = {}
+        for prefix, members in itertools.groupby(self, key=lambda pair: pair[0] >> shift):
+            network = ipaddress.IPv6Network(((prefix << shift) << 64, prefix_len))
+            groups[str(network)] = sum(1 for _ in members)
+        return groups
+
+
+def _merge_difference(left, right):
+    """有序序列归并: 返回 left 中不在 right 里的元素"""
+    result = []
+    j = 0
+    n = len(right)
+    for value in left:
+        while j < n and right[j] < value:
+            j += 1
+        if j >= n or right[j] != value:
+            result.append(value)
+    return result
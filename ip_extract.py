@@ -0,0 +1,86 @@
+import re
+import ipaddress
+
+# 单遍 IP 提取: 一个预编译正则同时匹配 IPv4/IPv6 候选, 命中即校验, 可按块处理流式响应体
+# IPv4 用整数比较校验 (与 ipaddress 一致: 每段 0-255, 不允许前导零); IPv6 命中很少, 交给 ipaddress 校验
+# 数字只认 ASCII [0-9] (\d 会匹配阿拉伯数字等, int() 也能转换, 但 inet_aton 不认);
+# IPv6 前后不能紧挨字母数字, 且不能以 :: 结尾, 避免 'std::map' 里的 'd::' 之类被当成地址
+_V4 = r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b'
+_V6 = r'(?<![0-9A-Za-z_:])(?:[0-9A-Fa-f]{1,4}|:)(?::[0-9A-Fa-f]{0,4}){1,7}(?![0-9A-Za-z_:])'
+PATTERN = re.compile(f'(?=[0-9A-Fa-f:])(?:(?P<v4>{_V4})|(?P<v6>{_V6}))')
+
+# 单个候选的最大长度 (IPv6 最长 39 字符), 流式处理时块尾这么长的部分留到下一块再判断
+MAX_TOKEN = 48
+
+
+def _valid_v4(text):
+    if not text.isascii():
+        return False
+    for part in text.split('.'):
+        if int(part) > 255 or (len(part) > 1 and part[0] == '0'):
+            return False
+    return True
+
+
+def _valid_v6(text):
+    if text.count(':') < 2 or text.endswith('::') or not text.isascii():
+        return False
+    try:
+        ipaddress.IPv6Address(text)
+    except ValueError:
+        return False
+    return True
+
+
+def _scan(text, pos, endpos):
+    """扫描 text[pos:] 中起点小于 endpos 的候选, 返回 ([(版本, ip)], 最后一个命中的结束位置)"""
+    found = []
+    last_end = pos
+    for match in PATTERN.finditer(text, pos):
+        if match.start() >= endpos:
+            break
+        last_end = match.end()
+        v4 = match.group('v4')
+        if v4 is not None:
+            if _valid_v4(v4):
+                found.append((4, v4))
+        else:
+            v6 = match.group('v6')
+            if _valid_v6(v6):
+                found.append((6, v6.lower()))
+    return found, last_end
+
+
+def iter_ips(chunks):
+    """逐块扫描文本, 依次产出 (4 或 6, ip); 块边界处的候选会等下一块到齐后再判断"""
+    buffer = ''
+    pos = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        # 起点在 limit 之前的候选, 其完整内容和后继字符都已在缓冲区内, 可以定论
+        limit = len(buffer) - MAX_TOKEN - 1
+        if limit <= pos:
+            continue
+        found, last_end = _scan(buffer, pos, limit)
+        yield from found
+        resume = max(last_end, limit)
+        # 保留 1 个字符给 \b / 后顾断言作上下文
+        buffer = buffer[resume - 1:]
+        pos = 1
+    found, _ = _scan(buffer, pos, len(buffer) + 1)
+    yield from found
+
+
+def extract_chunks(chunks):
+    """逐块提取, 返回 (IPv4 列表, IPv6 列表), 保留出现顺序与重复"""
+    ipv4, ipv6 = [], []
+    for version, ip in iter_ips(chunks):
+        (ipv4 if version == 4 else ipv6).append(ip)
+    return ipv4, ipv6
+
+
+def extract(text):
+    """整段文本提取, 同 extract_chunks"""
+    return extract_chunks([text])
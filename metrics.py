@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import threading
+
+import fileutil
+
+# 运行指标: 分阶段计时、计数器、直方图, 运行结束时写成 JSON 和 Prometheus 文本 (与 speed_ip.txt 同目录)
+# 各模块直接调用 inc / observe / record, 不需要传递对象; 不写文件时只占少量内存
+PREFIX = 'yxip_'
+# 直方图分桶上界; 未列出的指标用 DEFAULT_BUCKETS
+BUCKETS = {
+    'speed_mbps': (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200),
+    'speed_connect_seconds': (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'speed_ttfb_seconds': (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'speed_test_seconds': (0.5, 1, 2, 5, 10, 20, 30, 60),
+    'probe_rtt_ms': (10, 25, 50, 100, 200, 300, 500, 1000, 2000),
+}
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+_counters = {}  # (名称, 标签元组) -> 值
+_histograms = {}  # (名称, 标签元组) -> [各桶计数, 总和, 次数]
+_phases = {}  # 阶段名 -> 秒
+_records = {}  # 分组 -> {键: 字典}, 只写入 JSON
+_current_phase = None
+_started = time.time()
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """计数器加 value"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """直方图记一个观测值"""
+    key = _key(name, labels)
+    bounds = BUCKETS.get(name, DEFAULT_BUCKETS)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(bounds), 0.0, 0]
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                hist[0][i] += 1
+        hist[1] += value
+        hist[2] += 1
+
+
+def record(group, key, **fields):
+    """逐项明细 (如每个 IP 的耗时与结果), 只写入 JSON"""
+    with _lock:
+        _records.setdefault(group, {})[key] = fields
+
+
+def start_phase(name):
+    """结束上一个阶段并开始新阶段; 脚本按顺序调用即可, write 时自动结束最后一个"""
+    global _current_phase
+    now = time.monotonic()
+    with _lock:
+        if _current_phase:
+            previous, started = _current_phase
+            _phases[previous] = _phases.get(previous, 0.0) + now - started
+        _current_phase = (name, now) if name else None
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+def _prometheus():
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {PREFIX}{name} {kind}')
+
+    for (name, labels), value in sorted(_counters.items()):
+        header(name, 'counter')
+        lines.append(f'{PREFIX}{name}{_format_labels(labels)} {value}')
+    for (name, labels), (counts, total, count) in sorted(_histograms.items()):
+        header(name, 'histogram')
+        for bound, n in zip(BUCKETS.get(name, DEFAULT_BUCKETS), counts):
+            lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels, [("le", bound)])} {n}')
+        lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+        lines.append(f'{PREFIX}{name}_sum{_format_labels(labels)} {round(total, 6)}')
+        lines.append(f'{PREFIX}{name}_count{_format_labels(labels)} {count}')
+    header('phase_seconds', 'gauge')
+    for phase, seconds in _phases.items():
+        lines.append(f'{PREFIX}phase_seconds{_format_labels([("phase", phase)])} {round(seconds, 3)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _snapshot(script):
+    def label_text(labels):
+        return ','.join(f'{k}={v}' for k, v in labels)
+
+    return {
+        'script': script,
+        'started': _started,
+        'finished': time.time(),
+        'phases': {phase: round(seconds, 3) for phase, seconds in _phases.items()},
+        'counters': {name + (f'{{{label_text(labels)}}}' if labels else ''): value for (name, labels), value in sorted(_counters.items())},
+        'histograms': {
+            name + (f'{{{label_text(labels)}}}' if labels else ''): {
+                'buckets': dict(zip(map(str, BUCKETS.get(name, DEFAULT_BUCKETS)), counts)), 'sum': round(total, 6), 'count': count}
+            for (name, labels), (counts, total, count) in sorted(_histograms.items())
+        },
+        'records': _records,
+    }
+
+
+def write(name, directory='.'):
+    """结束当前阶段, 写出 {name}.json 与 {name}.prom, 返回两个路径"""
+    start_phase(None)
+    with _lock:
+        snapshot = json.dumps(_snapshot(name), ensure_ascii=False, indent=1)
+        prometheus = _prometheus()
+    json_path = os.path.join(directory, f'{name}.json')
+    prom_path = os.path.join(directory, f'{name}.prom')
+    fileutil.write_atomic(json_path, snapshot)
+    fileutil.write_atomic(prom_path, prometheus)
+    return json_path, prom_path
@@ -0,0 +1,92 @@
+import os
+import ssl
+import socket
+import time
+import asyncio
+
+# 测速前的廉价初筛: 并发完成 TCP + TLS 握手 (SNI speed.cloudflare.com), 记录两段耗时
+# 握不上手或 RTT 过高的 IP 不再参加 10MB 下载, 只把最好的 K 个送去测带宽
+HOST = 'speed.cloudflare.com'
+PORT = 443
+PROBE_CONCURRENCY = int(os.environ.get('PROBE_CONCURRENCY', 256))
+PROBE_CONCURRENCY_V6 = int(os.environ.get('PROBE_CONCURRENCY_V6', 64))  # IPv6 单独限流, 路由不通时不挤占 IPv4 名额
+PROBE_TIMEOUT = float(os.environ.get('PROBE_TIMEOUT', 5))
+MAX_RTT_MS = float(os.environ.get('PROBE_MAX_RTT_MS', 1000))  # TCP + TLS 总耗时上限
+TOP_K = int(os.environ.get('PROBE_TOP_K', 120))  # 0 表示不限
+IPV6_ROUTE_CHECK = ('2606:4700:4700::1111', 443)
+
+
+def family(ip):
+    """地址族: 4 或 6"""
+    return 6 if ':' in ip else 4
+
+
+def ipv6_route_available():
+    """本机是否有 IPv6 默认路由; UDP connect 不发包, 无路由时立即报 ENETUNREACH"""
+    try:
+        with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as s:
+            s.connect(IPV6_ROUTE_CHECK)
+        return True
+    except OSError:
+        return False
+
+
+def ssl_context():
+    """与 curl --insecure 一致, 不校验证书 (握手探测与 speed_meter 的下载共用)"""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+async def probe_one(ip, port=PORT, timeout=PROBE_TIMEOUT, context=None, semaphore=None):
+    """握手探测单个 IP, 返回 {'ip', 'port', 'ok', 'connect_ms', 'tls_ms', 'rtt_ms', 'error'}"""
+    result = {'ip': ip, 'port': port, 'ok': False, 'connect_ms': None, 'tls_ms': None, 'rtt_ms': None, 'error': None}
+    context = context or ssl_context()
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+    async with semaphore:
+        writer = None
+        try:
+            start = time.perf_counter()
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+            connected = time.perf_counter()
+            await asyncio.wait_for(writer.start_tls(context, server_hostname=HOST), timeout)
+            done = time.perf_counter()
+            result.update(ok=True,
+                          connect_ms=round((connected - start) * 1000, 1),
+                          tls_ms=round((done - connected) * 1000, 1),
+                          rtt_ms=round((done - start) * 1000, 1))
+        except asyncio.TimeoutError:
+            result['error'] = 'timeout'
+        except (OSError, ssl.SSLError) as e:
+            result['error'] = type(e).__name__
+        finally:
+            if writer is not None:
+                writer.close()
+                try:
+                    # 对端在 TLS 握手中途断开时 wait_closed 可能永不返回, 同样限时
+                    await asyncio.wait_for(writer.wait_closed(), timeout)
+                except (OSError, ssl.SSLError, asyncio.TimeoutError):
+                    pass
+    return result
+
+
+async def _probe_all(targets, concurrency, concurrency_v6, timeout):
+    semaphores = {4: asyncio.Semaphore(concurrency), 6: asyncio.Semaphore(concurrency_v6)}
+    context = ssl_context()
+    return await asyncio.gather(*(probe_one(ip, port, timeout, context, semaphores[family(ip)]) for ip, port in targets))
+
+
+def probe_all(targets, concurrency=PROBE_CONCURRENCY, timeout=PROBE_TIMEOUT, concurrency_v6=PROBE_CONCURRENCY_V6):
+    """并发探测 [(ip, port), ...] (IPv4/IPv6 各自限流), 返回与输入同序的结果列表"""
+    targets = list(targets)
+    if not targets:
+        return []
+    return asyncio.run(_probe_all(targets, concurrency, concurrency_v6, timeout))
+
+
+def select_best(results, k=TOP_K, max_rtt_ms=MAX_RTT_MS):
+    """去掉握手失败和 RTT 超限的, 按 RTT 升序取前 k 个"""
+    passed = sorted((r for r in results if r['ok'] and r['rtt_ms'] <= max_rtt_ms), key=lambda r: r['rtt_ms'])
+    return passed[:k] if k > 0 else passed
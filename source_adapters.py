@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+from html.parser import HTMLParser
+
+import ip_extract
+import source_fetch
+
+# IP 来源适配器: 每个源在 ip_sources.json 里声明类型 (text / html / json / browser) 与可选参数
+# 各类型有自己的解析方式和超时; 浏览器渲染等重依赖只在配置里有启用的该类型源时才导入
+SOURCES_FILE = os.environ.get('IP_SOURCES', 'ip_sources.json')
+MIN_CONTENT = 100  # 内容不超过这么多字符视为空页面
+
+
+class TextSource:
+    """纯文本列表: 响应体按块流式提取"""
+    kind = 'text'
+    timeout = 7
+    packages = ()  # 除 requests 外需要安装的 pip 包
+
+    def __init__(self, url, timeout=None, **options):
+        self.url = url
+        self.timeout = timeout or self.timeout
+        self.options = options
+
+    def fetch(self, session, entry):
+        """返回 (状态码, (IPv4 列表, IPv6 列表) 或 None, 响应头); entry 为上次的缓存状态, 用于条件请求"""
+        return source_fetch.fetch_one(session, self.url, entry, self.extract, self.timeout)
+
+    def text(self, chunks):
+        """把响应体块转成要扫描的文本块, 子类按格式改写"""
+        return chunks
+
+    def extract(self, url, chunks):
+        size = 0
+
+        def counted():
+            nonlocal size
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+
+        valid_ipv4, valid_ipv6 = ip_extract.extract_chunks(self.text(counted()))
+        if size <= MIN_CONTENT:  # 过滤空内容
+            print(f'{url} content empty or too short, skipping')
+            return [], []
+        print(f'From {url} ({self.kind}) extracted: {len(valid_ipv4)} IPv4, {len(valid_ipv6)} IPv6 (content {size} chars)')
+        return valid_ipv4, valid_ipv6
+
+
+class _VisibleText(HTMLParser):
+    """收集 script / style 以外的文本, 脚本里的版本号、CSS 数值不会被误当成 IP
+
+    parts 为已完整的文本段 (遇到标签才算结束); 喂入的块可能断在文本中间, 未结束的一段留在 current 里等下一块
+    """
+    SKIP = {'script', 'style', 'noscript'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.current = ''
+        self.skipping = 0
+
+    def _boundary(self):
+        if self.current:
+            self.parts.append(self.current)
+            self.current = ''
+
+    def handle_starttag(self, tag, attrs):
+        self._boundary()
+        if tag in self.SKIP:
+            self.skipping += 1
+
+    def handle_endtag(self, tag):
+        self._boundary()
+        if tag in self.SKIP and self.skipping:
+            self.skipping -= 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._boundary()
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.current += data
+
+    def close(self):
+        super().close()
+        self._boundary()
+
+
+class HtmlSource(TextSource):
+    """HTML 页面: 边下载边解析, 只扫描可见文本"""
+    kind = 'html'
+    timeout = 10
+
+    def text(self, chunks):
+        parser = _VisibleText()
+        for chunk in chunks:
+            parser.feed(chunk)
+            # 只在标签处补换行, 相邻单元格里的数字不会粘成一个候选; 块尾未结束的文本段不输出
+            if parser.parts:
+                yield '\n'.join(parser.parts) + '\n'
+                parser.parts.clear()
+        parser.close()
+        yield '\n'.join(parser.parts)
+
+
+class JsonSource(TextSource):
+    """JSON 接口: 取所有字符串值 (配置 fields 时只取这些键下的) 再提取"""
+    kind = 'json'
+    timeout = 10
+
+    def text(self, chunks):
+        data = json.loads(''.join(chunks))
+        fields = set(self.options.get('fields') or ())
+        values = []
+
+        def walk(node, selected):
+            if isinstance(node, dict):
+                for key, value in node.items():
+                    walk(value, selected or key in fields)
+            elif isinstance(node, list):
+                for value in node:
+                    walk(value, selected)
+            elif isinstance(node, str) and selected:
+                values.append(node)
+
+        walk(data, not fields)
+        return ['\n'.join(values)]
+
+
+class BrowserSource(HtmlSource):
+    """需要执行 JS 的动态页面: 无头 Chrome 渲染后按 HTML 提取; 不支持条件请求, 每轮都完整渲染"""
+    kind = 'browser'
+    timeout = 30
+    packages = ('selenium',)
+
+    def fetch(self, session, entry):
+        # 只有配置了浏览器源才导入 selenium (4.6 起自带 Selenium Manager 下载匹配的 chromedriver)
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.common.exceptions import TimeoutException
+
+        print(f'Using Selenium for dynamic site: {self.url}')
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")  # 无头模式,适合Actions
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        driver = webdriver.Chrome(options=chrome_options)
+        try:
+            driver.set_page_load_timeout(self.timeout)
+            driver.get(self.url)
+            # 等到页面文本里出现 IP 再取源码, 最多等 wait 秒 (默认 10)
+            try:
+                WebDriverWait(driver, self.options.get('wait', 10)).until(
+                    lambda d: ip_extract.PATTERN.search(d.find_element(By.TAG_NAME, 'body').text))
+            except TimeoutException:
+                print(f'{self.url}: no IP rendered within wait, using current page')
+            html_content = driver.page_source
+        finally:
+            driver.quit()
+        return 200, self.extract(self.url, [html_content]), {}
+
+
+ADAPTERS = {cls.kind: cls for cls in (TextSource, HtmlSource, JsonSource, BrowserSource)}
+
+
+def load_sources(path=SOURCES_FILE):
+    """读源配置: [{"url": ..., "type": "text", "timeout": 秒, "enabled": true, 其余为类型参数}], 返回启用的适配器列表"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    sources = []
+    for item in config:
+        item = dict(item)
+        if not item.pop('enabled', True):
+            continue
+        kind = item.pop('type', 'text')
+        if kind not in ADAPTERS:
+            raise ValueError(f"{path}: 未知的源类型 {kind} ({item.get('url')})")
+        sources.append(ADAPTERS[kind](**item))
+    return sources
+
+
+def requirements(sources):
+    """启用的源额外需要的 pip 包 (不含 requests)"""
+    return sorted({package for source in sources for package in source.packages})
+
+
+if __name__ == '__main__':
+    # python source_adapters.py requirements: 打印需额外安装的包, 供 workflow 按配置安装
+    if sys.argv[1:] == ['requirements']:
+        print(' '.join(requirements(load_sources())))
+    else:
+        sys.exit('用法: python source_adapters.py requirements')
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import fileutil
+import ip_extract
+import metrics
+
+# 源缓存状态文件 (ETag/Last-Modified + 上次解析出的IP), 由 Actions cache 跨运行保存
+STATE_FILE = os.path.join('.cache', 'sources.json')
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# 同时下载的源数量上限 (也是连接池大小)
+MAX_WORKERS = 8
+
+
+def load_state(path=STATE_FILE):
+    """读取各源的缓存状态, 文件不存在或损坏时返回空字典"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, path=STATE_FILE):
+    """原子写, 避免中断时留下半个 JSON"""
+    fileutil.write_atomic(path, json.dumps(state, ensure_ascii=False))
+
+
+def make_session(pool_size=MAX_WORKERS):
+    """所有源共用一个 Session, raw.githubusercontent.com 的连接可复用"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def fetch_one(session, url, entry, parse, timeout=7):
+    """条件请求单个源, 返回 (状态码, 解析结果, 响应头); 仅在有缓存IP时才带 If-None-Match/If-Modified-Since
+
+    200 时响应体按块流式交给 parse(url, chunks), 大页面不必整体读入内存
+    """
+    headers = {}
+    if entry and 'ipv4' in entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    start = time.monotonic()
+    with session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+        parsed = None
+        if response.status_code == 200:
+            response.encoding = response.encoding or 'utf-8'
+            parsed = parse(url, _counted(response.iter_content(chunk_size=65536, decode_unicode=True)))
+        metrics.observe('source_fetch_seconds', time.monotonic() - start)
+        return response.status_code, parsed, response.headers
+
+
+def _counted(chunks):
+    for chunk in chunks:
+        metrics.inc('source_chars_total', len(chunk))
+        yield chunk
+
+
+def fetch_all(sources, state_file=STATE_FILE, max_workers=MAX_WORKERS):
+    """并发获取所有源 (source_adapters 中的适配器); 200 时由适配器在下载线程里解析出 (ipv4列表, ipv6列表) 并更新缓存, 304 直接复用上次结果
+
+    返回 {url: (ipv4列表, ipv6列表)}, 请求失败的源不在结果中
+    """
+    state = load_state(state_file)
+    # 源类型改了的, 上次的解析结果不再适用, 不带条件请求
+    entries = {s.url: state[s.url] for s in sources if s.url in state and state[s.url].get('kind', 'text') == s.kind}
+    results = {}
+    session = make_session(max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(source.fetch, session, entries.get(source.url)): source for source in sources}
+            for future in as_completed(futures):
+                source = futures[future]
+                url = source.url
+                entry = entries.get(url)
+                try:
+                    status, parsed, headers = future.result()
+                except Exception as e:
+                    print(f'Failed to process {url}: {e}')
+                    metrics.inc('source_fetches_total', status='error')
+                    continue
+                metrics.inc('source_fetches_total', status=status)
+                if status == 304 and entry:
+                    # 缓存可能来自旧版提取规则 (曾收下非 ASCII 数字等), 复用前按当前规则再过一遍
+                    ipv4, ipv6 = ip_extract.extract('\n'.join(entry['ipv4'] + entry['ipv6']))
+                    print(f'{url} not modified (304), reusing {len(ipv4)} IPv4, {len(ipv6)} IPv6')
+                    entry['ipv4'], entry['ipv6'] = ipv4, ipv6
+                    results[url] = (ipv4, ipv6)
+                elif status == 200:
+                    ipv4, ipv6 = parsed
+                    state[url] = {
+                        'kind': source.kind,
+                        'etag': headers.get('ETag'),
+                        'last_modified': headers.get('Last-Modified'),
+                        'fetched_at': int(time.time()),
+                        'ipv4': ipv4,
+                        'ipv6': ipv6,
+                    }
+                    results[url] = (ipv4, ipv6)
+                else:
+                    print(f'Request failed for {url}: status {status}')
+    finally:
+        session.close()
+    # 只保留当前配置中的源, 注释掉的源不再占用缓存
+    save_state({s.url: state[s.url] for s in sources if s.url in state}, state_file)
+    return results
@@ -0,0 +1,49 @@
+import os
+
+import probe
+import metrics
+
+# 并发测速调度: 先用 TCP/TLS 握手并行初筛, 再按总带宽预算限制同时进行的下载数
+# 总带宽预算 (MB/s) / 单个测速的预期峰值 (MB/s) = 同时下载数, 避免并发测速互相挤占网卡带宽而压低结果
+BANDWIDTH_BUDGET_MBPS = float(os.environ.get('SPEED_BUDGET_MBPS', 250))
+PER_TEST_MBPS = float(os.environ.get('SPEED_PER_TEST_MBPS', 120))
+CF_HTTPS_PORTS = (443, 2053, 2083, 2087, 2096, 8443)  # Cloudflare 代理支持的 HTTPS 端口
+IPV6_CANARY = 8  # 先探测这么多个 IPv6 目标, 全部失败即认为本机 IPv6 不通, 其余不再逐个超时
+
+
+def download_slots(budget_mbps=BANDWIDTH_BUDGET_MBPS, per_test_mbps=PER_TEST_MBPS):
+    """带宽预算允许的同时下载数, 至少 1"""
+    return max(1, int(budget_mbps // per_test_mbps))
+
+
+def screen(targets, k=probe.TOP_K, max_rtt_ms=probe.MAX_RTT_MS, best_port=False):
+    """握手初筛 [(ip, 端口)], 返回 (入选 (ip, 端口) 列表 (按 RTT 升序), {(ip, 端口): 探测结果})
+
+    best_port 为真时同一 IP 的多个端口一起并发握手, 只保留 RTT 最好的端口参加排名;
+    本机 IPv6 不通时 IPv6 目标不探测, 不出现在探测结果里
+    """
+    unique_targets = list(dict.fromkeys(targets))
+    ipv6_targets = [t for t in unique_targets if probe.family(t[0]) == 6]
+    results = []
+    if ipv6_targets:
+        canary = probe.probe_all(ipv6_targets[:IPV6_CANARY]) if probe.ipv6_route_available() else []
+        if any(r['ok'] for r in canary):
+            results = canary
+        else:
+            print(f"IPv6 不可用 (无路由或前 {len(canary)} 个探测全部失败)，跳过 {len(ipv6_targets)} 个 IPv6 目标")
+            unique_targets = [t for t in unique_targets if probe.family(t[0]) == 4]
+    probed = {(r['ip'], r['port']) for r in results}
+    results += probe.probe_all([t for t in unique_targets if t not in probed])
+    candidates = results
+    if best_port:
+        fastest = {}
+        for r in results:
+            if r['ok'] and (r['ip'] not in fastest or r['rtt_ms'] < fastest[r['ip']]['rtt_ms']):
+                fastest[r['ip']] = r
+        candidates = list(fastest.values())
+    for r in results:
+        metrics.inc('probe_total', result='ok' if r['ok'] else r['error'])
+        if r['ok']:
+            metrics.observe('probe_rtt_ms', r['rtt_ms'])
+    best = probe.select_best(candidates, k, max_rtt_ms)
+    return [(r['ip'], r['port']) for r in best], {(r['ip'], r['port']): r for r in results}
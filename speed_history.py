@@ -0,0 +1,115 @@
+import os
+import time
+import math
+import sqlite3
+
+# 测速历史: 每个 IP:端口 的逐次样本 + 指数加权得分, 由 Actions cache 跨运行保存
+# 每轮只重测排名不确定的 IP, 前 50 名按加权得分而不是单次样本排
+HISTORY_FILE = os.environ.get('SPEED_HISTORY', os.path.join('.cache', 'speed_history.sqlite'))
+ALPHA = 0.3  # EWMA 新样本权重
+DEAD_FAILS = 3  # 连续失败这么多次视为死 IP
+DEAD_RETRY_SECONDS = 24 * 3600  # 死 IP 每天重测一次
+STABLE_MIN_SAMPLES = 3
+STABLE_CV = 0.1  # 变异系数 (标准差/均值) 低于 10% 视为稳定
+STABLE_MAX_AGE = 6 * 3600  # 稳定 IP 超过 6 小时未测仍需重测
+MAX_AGE = 24 * 3600  # 超过一天未成功测速的不参与排名
+SAMPLE_KEEP_SECONDS = 30 * 86400
+
+
+class History:
+    def __init__(self, path=HISTORY_FILE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS samples ('
+            ' key TEXT NOT NULL, ts REAL NOT NULL, mbps REAL NOT NULL, ok INTEGER NOT NULL, label TEXT)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS samples_key ON samples (key, ts)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS scores ('
+            ' key TEXT PRIMARY KEY, ewma REAL NOT NULL DEFAULT 0, ewvar REAL NOT NULL DEFAULT 0,'
+            ' n INTEGER NOT NULL DEFAULT 0, fails INTEGER NOT NULL DEFAULT 0,'
+            ' last_ts REAL, last_ok_ts REAL, label TEXT)'
+        )
+
+    def score(self, key):
+        """返回该 key 的得分行字典, 无记录时返回 None"""
+        row = self.conn.execute('SELECT ewma, ewvar, n, fails, last_ts, last_ok_ts, label FROM scores WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('ewma', 'ewvar', 'n', 'fails', 'last_ts', 'last_ok_ts', 'label'), row))
+
+    def needs_test(self, key, now=None):
+        """是否需要本轮重测, 返回 (是否重测, 原因)"""
+        now = now or time.time()
+        s = self.score(key)
+        if s is None:
+            return True, 'new'
+        age = now - (s['last_ts'] or 0)
+        if s['fails'] >= DEAD_FAILS:
+            return age >= DEAD_RETRY_SECONDS, 'dead'
+        if s['n'] >= STABLE_MIN_SAMPLES and s['ewma'] > 0 and s['fails'] == 0:
+            cv = math.sqrt(s['ewvar']) / s['ewma']
+            if cv <= STABLE_CV:
+                return age >= STABLE_MAX_AGE, 'stable'
+        return True, 'uncertain'
+
+    def select(self, keys, now=None):
+        """从 keys 中挑出本轮要测的, 返回 (要测的 key 列表, {原因: 跳过数})"""
+        now = now or time.time()
+        selected = []
+        skipped = {}
+        for key in dict.fromkeys(keys):
+            test, reason = self.needs_test(key, now)
+            if test:
+                selected.append(key)
+            else:
+                skipped[reason] = skipped.get(reason, 0) + 1
+        return selected, skipped
+
+    def record(self, key, mbps, label=None, now=None):
+        """记录一次测速; mbps <= 0 视为失败, 只累计连续失败数不拉低得分"""
+        now = now or time.time()
+        ok = mbps > 0
+        self.conn.execute('INSERT INTO samples (key, ts, mbps, ok, label) VALUES (?, ?, ?, ?, ?)', (key, now, mbps, int(ok), label))
+        s = self.score(key)
+        if s is None:
+            s = {'ewma': 0.0, 'ewvar': 0.0, 'n': 0, 'fails': 0, 'last_ts': None, 'last_ok_ts': None, 'label': None}
+        if ok:
+            if s['n'] == 0:
+                s['ewma'], s['ewvar'] = mbps, 0.0
+            else:
+                diff = mbps - s['ewma']
+                s['ewma'] += ALPHA * diff
+                s['ewvar'] = (1 - ALPHA) * (s['ewvar'] + ALPHA * diff * diff)
+            s['n'] += 1
+            s['fails'] = 0
+            s['last_ok_ts'] = now
+            s['label'] = label or s['label']
+        else:
+            s['fails'] += 1
+        self.conn.execute(
+            'INSERT OR REPLACE INTO scores (key, ewma, ewvar, n, fails, last_ts, last_ok_ts, label) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, s['ewma'], s['ewvar'], s['n'], s['fails'], now, s['last_ok_ts'], s['label'])
+        )
+
+    def ranking(self, keys, now=None):
+        """keys 中当前可用的 IP, 返回 [(key, 得分, 标签, 成功样本数)], 顺序同 keys (取前 N 见 speed_results.top_n);
+        最近一次失败或太久没成功的不参与"""
+        now = now or time.time()
+        ranked = []
+        for key in dict.fromkeys(keys):
+            s = self.score(key)
+            if s and s['n'] > 0 and s['fails'] == 0 and now - s['last_ok_ts'] <= MAX_AGE:
+                ranked.append((key, s['ewma'], s['label'], s['n']))
+        return ranked
+
+    def prune(self, now=None):
+        """删除过旧的逐次样本, 以及长期未再出现的 IP 的得分"""
+        now = now or time.time()
+        self.conn.execute('DELETE FROM samples WHERE ts < ?', (now - SAMPLE_KEEP_SECONDS,))
+        self.conn.execute('DELETE FROM scores WHERE last_ts < ?', (now - SAMPLE_KEEP_SECONDS,))
+
+    def close(self):
+        self.conn.close()
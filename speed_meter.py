@@ -0,0 +1,125 @@
+import ssl
+import time
+import socket
+
+import probe
+
+# 进程内流式测速: 直连指定 IP (等同 curl --resolve), SNI/Host 仍为 speed.cloudflare.com
+# 响应体读进预分配缓冲区后直接丢弃, 记录首字节时间与吞吐时间序列, 报告剔除 TCP 慢启动后的稳态速度
+HOST = 'speed.cloudflare.com'
+BUFFER_SIZE = 256 * 1024
+SAMPLE_INTERVAL = 0.05  # 吞吐采样间隔 (秒)
+STEADY_FRACTION = 0.8  # 速率首次达到峰值的 80% 之后视为稳态
+MIN_STEADY_SECONDS = 0.5  # 稳态窗口太短时退回整体平均
+
+
+_context = probe.ssl_context()
+
+
+def steady_mbps(samples):
+    """由 [(秒, 累计字节)] 计算稳态 MB/s: 跳过速率爬升阶段, 从首次达到平滑峰值 80% 的采样点算到最后"""
+    if len(samples) < 3:
+        return None
+    rates = []
+    for (t0, b0), (t1, b1) in zip(samples, samples[1:]):
+        rates.append((b1 - b0) / (t1 - t0) if t1 > t0 else 0.0)
+    # 3 点滑动平均, 避免单个突发采样被当成峰值
+    smoothed = [sum(rates[max(0, i - 2):i + 1]) / len(rates[max(0, i - 2):i + 1]) for i in range(len(rates))]
+    threshold = max(smoothed) * STEADY_FRACTION
+    start_index = next(i for i, rate in enumerate(smoothed) if rate >= threshold)
+    # smoothed[i] 覆盖 rates[i-2..i], 从窗口起点开始算
+    t_start, b_start = samples[max(0, start_index - 2)]
+    t_end, b_end = samples[-1]
+    if t_end - t_start < MIN_STEADY_SECONDS:
+        return None
+    return (b_end - b_start) / (t_end - t_start) / 1048576
+
+
+def measure(ip, path, port=443, host=HOST, max_time=30, connect_timeout=10, should_stop=None):
+    """下载 https://host:port{path} 但连到 ip, 返回测量结果字典
+
+    should_stop(result) 在每个采样点调用, 返回 True 时提前结束 (result['stopped'] 记为 True)
+    结果键: ok, status, bytes, expected, connect_s, ttfb_s, elapsed_s, samples, mbps_avg, mbps_steady, stopped, error
+    """
+    result = {'ok': False, 'status': None, 'bytes': 0, 'expected': None, 'connect_s': None, 'ttfb_s': None,
+              'elapsed_s': 0.0, 'samples': [], 'mbps_avg': 0.0, 'mbps_steady': 0.0, 'stopped': False, 'error': None}
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    start = time.perf_counter()
+    deadline = start + max_time
+    sock = None
+    try:
+        raw = socket.create_connection((ip, port), timeout=connect_timeout)
+        sock = _context.wrap_socket(raw, server_hostname=host)
+        result['connect_s'] = time.perf_counter() - start
+        sock.settimeout(max(0.1, deadline - time.perf_counter()))
+        host_header = host if port == 443 else f'{host}:{port}'
+        sock.sendall((f'GET {path} HTTP/1.1\r\nHost: {host_header}\r\nUser-Agent: curl/8.5.0\r\n'
+                      'Accept: */*\r\nAccept-Encoding: identity\r\nConnection: close\r\n\r\n').encode('ascii'))
+
+        # 读响应头, 头后面多读到的部分计入正文
+        header_end = -1
+        filled = 0
+        while header_end < 0:
+            n = sock.recv_into(view[filled:])
+            if not n:
+                raise ConnectionError('响应头未完整即断开')
+            if result['ttfb_s'] is None:
+                result['ttfb_s'] = time.perf_counter() - start
+            filled += n
+            header_end = buffer.find(b'\r\n\r\n', 0, filled)
+            if header_end < 0 and filled == len(buffer):
+                raise ConnectionError('响应头过长')
+        head = bytes(buffer[:header_end]).decode('latin-1').split('\r\n')
+        result['status'] = int(head[0].split()[1])
+        for line in head[1:]:
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-length':
+                result['expected'] = int(value.strip())
+        if result['status'] != 200:
+            raise ConnectionError(f'HTTP {result["status"]}')
+
+        body_start = time.perf_counter()
+        total = filled - (header_end + 4)
+        samples = [(0.0, 0), (0.0, total)] if total else [(0.0, 0)]
+        next_sample = body_start + SAMPLE_INTERVAL
+        expected = result['expected']
+        while expected is None or total < expected:
+            now = time.perf_counter()
+            if now >= deadline:
+                result['error'] = 'max-time'
+                break
+            sock.settimeout(deadline - now)
+            n = sock.recv_into(view)
+            if not n:
+                break
+            total += n
+            now = time.perf_counter()
+            if now >= next_sample:
+                samples.append((now - body_start, total))
+                next_sample = now + SAMPLE_INTERVAL
+                if should_stop:
+                    result['bytes'] = total
+                    result['samples'] = samples
+                    if should_stop(result):
+                        result['stopped'] = True
+                        break
+        elapsed = time.perf_counter() - body_start
+        if not samples or samples[-1][1] != total:
+            samples.append((elapsed, total))
+        result['bytes'] = total
+        result['samples'] = samples
+        result['elapsed_s'] = elapsed
+        result['mbps_avg'] = total / elapsed / 1048576 if elapsed > 0 else 0.0
+        result['mbps_steady'] = steady_mbps(samples) or result['mbps_avg']
+        result['ok'] = result['error'] is None and (expected is None or total >= expected or result['stopped'])
+    except socket.timeout:
+        result['error'] = 'timeout'
+    except (OSError, ssl.SSLError, ValueError, IndexError) as e:
+        result['error'] = result['error'] or f'{type(e).__name__}: {e}'
+    finally:
+        if sock is not None:
+            sock.close()
+        elif 'raw' in locals():
+            raw.close()
+    return result
@@ -0,0 +1,367 @@
+import os
+import re
+import time
+import queue
+import threading
+import functools
+import argparse
+import traceback
+
+import speed_meter
+import adaptive_speed
+import speed_engine
+import speed_history
+import candidates
+import speed_shard
+import speed_results
+import metrics
+
+# 测速流水线: 解析 → 握手初筛 → 带宽测速 → 地理标签 → 汇总, 各阶段由有界队列相连并行推进
+# 城市版 (test_speed.py) 与国家版 (国家查询test_speed.py) 共用本流水线, 只是标签阶段不同 (见 geo_labels)
+
+# CF 官方带宽测试端点 (10MB 随机数据)
+TEST_PATH = '/__down?bytes=10485760'  # 10MB
+HOST = 'speed.cloudflare.com'
+PORT = 443  # test_speed 未指定端口时使用
+FILE_SIZE = 10485760  # 字节，用于验证
+# 自适应模式 (SPEED_ADAPTIVE=1): 以上轮第 50 名为门槛, 明显远离门槛的提前结束、收敛即停, 最多读 10MB;
+# 默认关闭 (固定 10MB), 用 bench_speed.py 的热启动结果确认字节数低于固定模式后再打开
+ADAPTIVE = os.environ.get('SPEED_ADAPTIVE', '0') == '1'
+
+# 默认端口
+DEFAULT_PORT = 8443
+# 多端口模式: 每个 IP 的 Cloudflare HTTPS 端口一起并发握手, 只对握手最快的端口测带宽, 排名时同一 IP 只留得分最高的端口
+MULTI_PORT = os.environ.get('SPEED_MULTI_PORT', '0') == '1'
+# IPv6: 同时测 ipv6.txt 里的 [地址]:端口; 排名默认按地址族分开 (speed_ip.txt / speed_ipv6.txt), SPEED_RANK=merged 合并写入 speed_ip.txt
+IPV6 = os.environ.get('SPEED_IPV6', '1') == '1'
+RANK_MODE = os.environ.get('SPEED_RANK', 'split')
+
+LABEL_BATCH = 100  # 标签阶段攒批预解析的上限 (ip-api 批量接口每次 100 个)
+_DONE = object()  # 阶段结束标记
+
+
+def test_speed(ip, port=PORT, retries=1, cutoff=0.0):
+    """进程内流式测试 CF 带宽 (直连 IP:端口，等同 curl --resolve)，返回剔除慢启动后的稳态 MB/s，重试失败
+
+    cutoff 为上轮第 50 名的速度，仅自适应模式用于提前中止/决定是否换大文件
+    """
+    for attempt in range(retries + 1):
+        print(f" 测试 {ip}:{port} (尝试 {attempt+1})...")
+        if ADAPTIVE:
+            result = adaptive_speed.measure(ip, port, HOST, cutoff, max_time=30, connect_timeout=10)
+        else:
+            result = speed_meter.measure(ip, TEST_PATH, port=port, host=HOST, max_time=30, connect_timeout=10)
+        _observe(result)
+        if result['error'] is None:
+            downloaded = result['bytes']
+            if result['stopped'] or downloaded >= (result['expected'] or FILE_SIZE) * 0.9:
+                speed_mbps = result['mbps_steady']
+                if speed_mbps > 0:
+                    detail = f", {result['reason']} (第 {result['stages']} 档)" if ADAPTIVE else ''
+                    print(f" 成功！下载 {downloaded/1048576:.1f}MB, 首字节 {result['ttfb_s']*1000:.0f}ms, 平均 {result['mbps_avg']:.1f}MB/s, 稳态速度: {round(speed_mbps, 1)}MB/s{detail}")
+                    return round(speed_mbps, 1)
+            print(f" 下载不完整: {downloaded/1048576:.1f}MB")
+            return 0.0
+        print(f" 下载失败: {result['error']}")
+        if attempt < retries:
+            time.sleep(2)
+    return 0.0
+
+
+def _observe(result):
+    """单次下载的指标: 连接/首字节耗时、字节数、稳态速度, 失败按错误类型计数"""
+    if result['connect_s'] is not None:
+        metrics.observe('speed_connect_seconds', result['connect_s'])
+    if result['ttfb_s'] is not None:
+        metrics.observe('speed_ttfb_seconds', result['ttfb_s'])
+    metrics.inc('speed_bytes_total', result['bytes'])
+    if result['error'] is None:
+        metrics.inc('speed_downloads_total', result='ok')
+        metrics.observe('speed_mbps', result['mbps_steady'])
+    else:
+        metrics.inc('speed_downloads_total', result=result['error'].split(':')[0])
+
+
+def parse_entries(lines):
+    """解析 ip.txt / ipv6.txt 行 (格式: IP:PORT#US、IP#US 或 [IPv6]:PORT#US-IPV6)，返回 [(ip, 端口)]"""
+    entries = []
+    for line in lines:
+        match = re.match(r'^(?:(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})|\[([0-9A-Fa-f:.]+)\])(?::(\d+))?\s*#(.*)$', line)
+        if not match:
+            print(f"跳过无效行: {line}")
+            continue
+        ip = match.group(1) or match.group(2).lower()
+        entries.append((ip, int(match.group(3) or DEFAULT_PORT)))  # 优先自带端口，没有默认8443
+    return entries
+
+
+def final_rankings(results):
+    """results 为 [SpeedResult] (顺序不限); 多端口模式每个 IP 只留得分最高的端口,
+    按 RANK_MODE 分到各输出文件并各取前 50 (降序), 返回 {文件: [SpeedResult]}"""
+    if MULTI_PORT:
+        best = {}
+        for r in results:
+            if r.ip not in best or r.mbps > best[r.ip].mbps:
+                best[r.ip] = r
+        results = list(best.values())
+    if RANK_MODE == 'merged':
+        outputs = {'speed_ip.txt': results}
+    else:
+        outputs = {'speed_ip.txt': [r for r in results if r.family == 4]}
+        if IPV6:
+            outputs['speed_ipv6.txt'] = [r for r in results if r.family == 6]
+    return {path: speed_results.top_n(items) for path, items in outputs.items()}
+
+
+def write_rankings(outputs, label, summary):
+    """补齐标签与国旗代码后写出 final_rankings 的结果 (txt / md / json / csv); 返回 {文件: 行数}"""
+    ips = [r.ip for items in outputs.values() for r in items]
+    try:
+        codes = label.flags(ips)
+    except Exception as e:
+        print(f"国旗代码解析失败: {e}")
+        codes = {}
+    for items in outputs.values():
+        for r in items:
+            r.label = r.label or label.resolve(r.ip)
+            r.country_code = codes.get(r.ip)
+    title = f"IP 带宽测速结果 (IP:端口#{label.name} + 国旗 + 加权速率, 前 {speed_results.TOP_N} 名)"
+    return speed_results.render(outputs, title, summary)
+
+
+def run(targets, test_fn, label, slots=None, best_port=False):
+    """流水线测速 [(ip, 端口)], test_fn(ip, 端口) -> MB/s, 按完成顺序产出 ((ip, 端口), MB/s, 标签, 握手 RTT 毫秒)
+
+    best_port 见 speed_engine.screen; 握手失败的记 0.0、握手成功但未入选前 K 的记 None, 这两类与测速失败的都不解析标签 (标签为 None);
+    带宽队列容量为 2 倍下载并发, 初筛结果按 RTT 顺序边出边测; 标签阶段不限容量, 慢的地理接口不反压测速
+    """
+    unique_targets = list(dict.fromkeys(targets))
+    slots = slots or speed_engine.download_slots()
+    bandwidth_queue = queue.Queue(maxsize=slots * 2)
+    label_queue = queue.Queue()
+    sink = queue.Queue()
+    rtts = {}  # 初筛写入后才放进带宽队列, 之后只读
+    start = time.monotonic()
+
+    def probe_stage():
+        try:
+            started = time.monotonic()
+            selected, probes = speed_engine.screen(unique_targets, best_port=best_port)
+            metrics.inc('pipeline_busy_seconds_total', time.monotonic() - started, stage='probe')
+            reachable = sum(1 for r in probes.values() if r['ok'])
+            print(f"握手初筛: {reachable}/{len(probes)} 个 IP:端口 可握手, 取 RTT 最好的 {len(selected)} 个测带宽 (用时 {time.monotonic() - start:.1f}s)")
+            rtts.update((target, r['rtt_ms']) for target, r in probes.items() if r['ok'])
+            chosen = set(selected)
+            for target in unique_targets:
+                if target not in chosen:
+                    # 没有探测结果的 (本机 IPv6 不通而跳过) 与未入选同样不计入历史
+                    result = probes.get(target)
+                    sink.put((target, 0.0 if result and not result['ok'] else None, None, rtts.get(target)))
+            for target in selected:
+                bandwidth_queue.put(target)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            for _ in range(slots):
+                bandwidth_queue.put(_DONE)
+
+    def bandwidth_stage():
+        try:
+            while True:
+                target = bandwidth_queue.get()
+                if target is _DONE:
+                    break
+                started = time.monotonic()
+                try:
+                    speed = test_fn(*target)
+                except Exception as e:
+                    print(f" 测试 {target[0]}:{target[1]} 异常: {e}")
+                    speed = 0.0
+                elapsed = time.monotonic() - started
+                metrics.inc('pipeline_busy_seconds_total', elapsed, stage='bandwidth')
+                metrics.observe('speed_test_seconds', elapsed)
+                metrics.record('speed_tests', speed_results.make_result(*target).target, seconds=round(elapsed, 3), mbps=speed)
+                if speed > 0:
+                    label_queue.put((target, speed))
+                else:
+                    sink.put((target, speed, None, rtts.get(target)))
+        finally:
+            label_queue.put(_DONE)
+
+    def label_stage():
+        # 阻塞取到第一个后把队列里已就绪的一并取出, 整批预解析再逐个取标签 (命中缓存)
+        remaining = slots
+        try:
+            while remaining:
+                batch = []
+                item = label_queue.get()
+                while True:
+                    if item is _DONE:
+                        remaining -= 1
+                    else:
+                        batch.append(item)
+                    if len(batch) >= LABEL_BATCH:
+                        break
+                    try:
+                        item = label_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if not batch:
+                    continue
+                started = time.monotonic()
+                try:
+                    label.prefetch([ip for (ip, _), _ in batch])
+                except Exception as e:
+                    print(f"{label.name}批量预解析失败: {e}")
+                for target, speed in batch:
+                    try:
+                        name = label.resolve(target[0])
+                    except Exception as e:
+                        print(f"{label.name}解析失败 {target[0]}: {e}")
+                        name = None
+                    sink.put((target, speed, name, rtts.get(target)))
+                metrics.inc('pipeline_busy_seconds_total', time.monotonic() - started, stage='label')
+        finally:
+            sink.put(_DONE)
+
+    stages = [threading.Thread(target=probe_stage, daemon=True), threading.Thread(target=label_stage, daemon=True)]
+    stages += [threading.Thread(target=bandwidth_stage, daemon=True) for _ in range(slots)]
+    for thread in stages:
+        thread.start()
+    while True:
+        item = sink.get()
+        if item is _DONE:
+            break
+        yield item
+    for thread in stages:
+        thread.join()
+    print(f"流水线测速: {len(unique_targets)} 个 IP:端口, 同时 {slots} 个下载, 总用时 {time.monotonic() - start:.1f}s")
+
+
+def main(label, shard=None, output=None):
+    """label 为 geo_labels 中的标签口径 (CityLabel / CountryLabel)
+
+    shard 为 (i, N) 时只测哈希分到第 i 份的 IP (外加公共参照 IP), 结果写入分片文件 output 而不是 speed_ip.txt
+    """
+    print("=== 脚本开始运行 ===")
+    metrics.start_phase('read_input')
+    try:
+        lines = []
+        for path in ['ip.txt'] + (['ipv6.txt'] if IPV6 else []):
+            if not os.path.exists(path):
+                print(f"{path} 不存在！")
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                found = [line.strip() for line in f if line.strip() and not line.startswith('#') and not line.startswith('-')]
+            print(f"{path} 读取到 {len(found)} 个 IP")
+            lines += found
+        if not lines:
+            print("ip.txt 中无有效 IP！")
+            return
+        entries = parse_entries(lines)
+        references = []
+        if shard:
+            references = speed_shard.reference_ips([ip for ip, _ in entries])
+            entries = [(ip, port) for ip, port in entries if speed_shard.in_shard(ip, *shard) or ip in references]
+            print(f"分片 {shard[0]}/{shard[1]}: 本分片 {len(entries)} 个 IP:端口 (含参照 IP {references})")
+        metrics.start_phase('history_select')
+        # 按历史挑出排名不确定的 IP 重测：新的、波动大或过期的要测，稳定的和连续失败的跳过
+        history = speed_history.History()
+        # busi.txt 网段抽样候选 (BUSI_SAMPLES > 0 时)，与 ip.txt 一起走同一套测速流程
+        bandit = None
+        sampled = set()
+        if candidates.SAMPLES > 0 and os.path.exists(candidates.BUSI_FILE):
+            bandit = candidates.SubnetBandit(history.conn)
+            known = {ip for ip, _ in entries}
+            sampled = {ip for ip in bandit.sample(candidates.load_prefixes(), candidates.SAMPLES)
+                       if ip not in known and (not shard or speed_shard.in_shard(ip, *shard))}
+            entries += [(ip, DEFAULT_PORT) for ip in sorted(sampled)]
+            print(f"busi.txt 网段抽样: 新增 {len(sampled)} 个候选")
+        if MULTI_PORT:
+            entries = [(ip, p) for ip, port in entries for p in dict.fromkeys((port,) + speed_engine.CF_HTTPS_PORTS)]
+            print(f"多端口模式: 每个 IP 并发握手 {len(speed_engine.CF_HTTPS_PORTS)} 个端口，只测最快的端口")
+        keys = {speed_results.make_result(ip, port).target: (ip, port) for ip, port in entries}
+        to_test, skipped = history.select(keys)
+        # 参照 IP 每个分片每轮都要实测, 用于合并时折算各机器的带宽差异
+        to_test += [key for key, (ip, _) in keys.items() if ip in references and key not in to_test]
+        print(f"历史记录: 本轮重测 {len(to_test)} 个，跳过 {sum(skipped.values())} 个 {skipped}")
+        # 握手初筛后只测最好的 K 个，按带宽预算并发下载测速 (测的就是写入结果的端口)，测完即解析标签；历史库只在本线程写
+        cutoff = adaptive_speed.load_cutoff('speed_ip.txt') if ADAPTIVE else 0.0
+        metrics.start_phase('pipeline')
+        success_count = 0
+        failed_count = 0
+        measured = {}
+        rtts = {}
+        tests = run([keys[ip_port] for ip_port in to_test], functools.partial(test_speed, cutoff=cutoff), label, best_port=MULTI_PORT)
+        for (ip, port), speed, name, rtt_ms in tests:
+            # 抽样结果回写网段统计 (未入选的不计)，下轮向高收益网段倾斜
+            if bandit and ip in sampled and speed is not None:
+                bandit.update(ip, speed)
+            ip_port = speed_results.make_result(ip, port).target
+            rtts[ip_port] = rtt_ms
+            if speed is None:
+                print(f"\n测试 {ip_port} -> 未入选 (握手 RTT 不在前列或本机该地址族不通)")
+            elif speed > 0:
+                history.record(ip_port, speed, name)
+                measured[ip_port] = speed
+                success_count += 1
+                print(f"\n测试 {ip_port} - {name} -> 成功: {speed}MB/s")
+            else:
+                history.record(ip_port, 0.0)
+                failed_count += 1
+                print(f"\n测试 {ip_port} -> 失败: 连接不通")
+        print(f"{label.name}接口统计: {label.providers.stats()}")
+        metrics.inc('speed_results_total', success_count, result='ok')
+        metrics.inc('speed_results_total', failed_count, result='failed')
+        metrics.start_phase('ranking_write')
+        # 按历史加权得分取前 50 个写入 speed_ip.txt 等 (标签走缓存，与本脚本的城市/国家口径一致)
+        ranking = [speed_results.make_result(*keys[key], mbps=score, rtt_ms=rtts.get(key), samples=n)
+                   for key, score, _, n in history.ranking(keys)]
+        outputs = final_rankings(ranking)
+        if shard:
+            rows = [r for items in outputs.values() for r in items]
+            for r in rows:
+                r.label = label.resolve(r.ip)
+            speed_shard.write_partial(output, shard, rows, {key: speed for key, speed in measured.items() if keys[key][0] in references})
+            saved = {output: len(rows)}
+        else:
+            summary = {'tested': success_count + failed_count, 'ok': success_count, 'failed': failed_count, 'available': len(ranking)}
+            saved = write_rankings(outputs, label, summary)
+        history.prune()
+        history.close()
+        print(f"\n完成！本轮成功 {success_count} 个、失败 {failed_count} 个，历史可用 {len(ranking)} 个，按加权得分保存 {saved}")
+    except Exception as e:
+        print(f"脚本异常: {e}")
+        traceback.print_exc()
+    finally:
+        # 指标与 speed_ip.txt 同目录: speed_metrics.json / speed_metrics.prom
+        print(f"运行指标: {metrics.write('speed_metrics' if not shard else f'speed_metrics_shard_{shard[0]}_of_{shard[1]}')}")
+
+
+def merge(label, paths):
+    """合并各分片文件, 写出最终的 speed_ip.txt (及 speed_ipv6.txt 与同名 md / json / csv)"""
+    ranking = speed_shard.merge(paths)
+    saved = write_rankings(final_rankings(ranking), label, {'shards': len(paths), 'available': len(ranking)})
+    print(f"合并 {len(paths)} 个分片, 共 {len(ranking)} 个 IP:端口, 保存 {saved}")
+
+
+def cli(label, argv=None):
+    """命令行入口: 无参数为单机全量测速; --shard i/N 为分片测速; merge 文件... 合并分片结果"""
+    parser = argparse.ArgumentParser(description=f'Cloudflare IP 带宽测速 ({label.name}标签)')
+    parser.add_argument('command', nargs='?', choices=['merge'], help='merge: 合并分片结果文件')
+    parser.add_argument('partials', nargs='*', help='merge 的分片结果文件')
+    parser.add_argument('--shard', help='i/N: 只测稳定哈希分到第 i 份 (1..N) 的 IP')
+    parser.add_argument('--out', help='分片结果文件 (默认 speed_shard_i_of_N.json)')
+    args = parser.parse_args(argv)
+    if args.command == 'merge':
+        if not args.partials:
+            parser.error('merge 需要至少一个分片文件')
+        merge(label, args.partials)
+    elif args.shard:
+        try:
+            shard = speed_shard.parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        main(label, shard, args.out or f'speed_shard_{shard[0]}_of_{shard[1]}.json')
+    else:
+        main(label)
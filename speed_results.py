@@ -0,0 +1,101 @@
+import os
+import csv
+import io
+import json
+import time
+import heapq
+from dataclasses import dataclass, asdict, fields
+
+import fileutil
+
+# 测速结果: 结构化记录 + 有界堆取前 N + 一次渲染出 txt / md / json / csv
+# 所有文件先写临时文件再 os.replace, 读的一方 (Actions 提交、下游工具) 不会读到写了一半的文件
+TOP_N = 50
+FLAG_URL = 'https://flagcdn.com/w20/{}.png'
+
+
+@dataclass
+class SpeedResult:
+    ip: str
+    port: int
+    family: int  # 4 / 6
+    label: str = None
+    mbps: float = 0.0  # 历史加权得分
+    rtt_ms: float = None  # 本轮握手 RTT, 本轮未测的为 None
+    samples: int = 0  # 历史成功样本数
+    country_code: str = None  # md 国旗用
+
+    @property
+    def target(self):
+        """IP:端口 文本, IPv6 加方括号 (与历史库的 key 相同)"""
+        return f"[{self.ip}]:{self.port}" if self.family == 6 else f"{self.ip}:{self.port}"
+
+
+def make_result(ip, port, **values):
+    return SpeedResult(ip, int(port), 6 if ':' in ip else 4, **values)
+
+
+def top_n(results, n=TOP_N):
+    """按得分取前 n 个 (降序), 有界堆, 不对全部结果排序"""
+    return heapq.nlargest(n, results, key=lambda r: r.mbps)
+
+
+def render_txt(results):
+    # 格式: IP:端口#标签 速率
+    return ''.join(f"{r.target}#{r.label} {round(r.mbps, 1)}MB/s\n" for r in results)
+
+
+def render_md(results, title, summary, generated):
+    if 'shards' in summary:
+        totals = f"合并分片: {summary['shards']}"
+    else:
+        totals = f"本轮测试: {summary.get('tested', 0)}, 成功: {summary.get('ok', 0)}, 失败: {summary.get('failed', 0)}"
+    lines = [
+        f"# {title}",
+        '',
+        f"生成时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(generated))} UTC",
+        f"{totals}, 历史可用: {summary.get('available', 0)}, 保存: {len(results)}",
+        '',
+        '## 结果列表 (按加权得分降序):',
+        '',
+    ]
+    for r in results:
+        flag = f" ![国旗]({FLAG_URL.format(r.country_code.lower())})" if r.country_code and r.country_code != 'ZZ' else ''
+        rtt = f", RTT {r.rtt_ms:.0f}ms" if r.rtt_ms is not None else ''
+        lines.append(f"- {r.target} #{r.label}{flag} + {round(r.mbps, 1)}MB/s ({r.samples} 次样本{rtt})")
+    return '\n'.join(lines) + '\n'
+
+
+def render_json(results, summary, generated):
+    data = {'generated': generated, 'summary': summary, 'results': [asdict(r) for r in results]}
+    return json.dumps(data, ensure_ascii=False, indent=1) + '\n'
+
+
+def render_csv(results):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow([f.name for f in fields(SpeedResult)])
+    for r in results:
+        writer.writerow(['' if v is None else v for v in asdict(r).values()])
+    return out.getvalue()
+
+
+def render(outputs, title, summary, now=None):
+    """outputs 为 {speed_ip.txt 之类的路径: [SpeedResult]}; 每个路径同名写出 .txt / .md / .json / .csv, 返回 {txt 路径: 行数}"""
+    generated = now or time.time()
+    for path, results in outputs.items():
+        base = os.path.splitext(path)[0]
+        fileutil.write_atomic(f'{base}.txt', render_txt(results))
+        fileutil.write_atomic(f'{base}.md', render_md(results, title, summary, generated))
+        fileutil.write_atomic(f'{base}.json', render_json(results, summary, generated))
+        fileutil.write_atomic(f'{base}.csv', render_csv(results))
+    return {path: len(results) for path, results in outputs.items()}
+
+
+def load(path):
+    """读 render 写出的 json (传 speed_ip.txt 之类的路径也可), 返回 [SpeedResult]; 不存在时返回 []"""
+    try:
+        with open(os.path.splitext(path)[0] + '.json', 'r', encoding='utf-8') as f:
+            return [SpeedResult(**item) for item in json.load(f)['results']]
+    except (OSError, ValueError, KeyError, TypeError):
+        return []
@@ -0,0 +1,87 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import statistics
+from dataclasses import asdict, replace
+
+import fileutil
+import speed_results
+
+# 多机分片测速: 每台机器按 IP 的稳定哈希只测自己那一份, 结果写成分片文件, 最后 merge 合并出总排名
+# 各机器带宽不同, 所以每个分片都额外测几个公共的参照 IP, 合并时按参照 IP 的速度比把各分片的得分折算到同一尺度
+REFERENCES = int(os.environ.get('SHARD_REFERENCES', 3))  # 每个分片都测的参照 IP 数
+
+
+def _hash(ip):
+    return int.from_bytes(hashlib.sha1(ip.encode()).digest()[:8], 'big')
+
+
+def parse_shard(text):
+    """'i/N' -> (i, N), i 从 1 起"""
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"分片格式应为 i/N: {text}")
+    if not 1 <= index <= count:
+        raise ValueError(f"分片序号应在 1..{count}: {text}")
+    return index, count
+
+
+def in_shard(ip, index, count):
+    """IP 是否归第 index 份; 同一 IP 的多个端口总在同一份"""
+    return _hash(ip) % count == index - 1
+
+
+def reference_ips(ips, n=REFERENCES):
+    """按哈希排序取前 n 个, 各分片读同一份 ip.txt 得到同一组参照 IP"""
+    return sorted(dict.fromkeys(ips), key=_hash)[:n]
+
+
+def write_partial(path, shard, ranking, references):
+    """写分片结果; ranking 为 [SpeedResult], references 为本轮参照 IP 实测 {IP:端口: MB/s}"""
+    data = {
+        'shard': f'{shard[0]}/{shard[1]}',
+        'runner': socket.gethostname(),
+        'created': time.time(),
+        'references': references,
+        'results': [asdict(r) for r in ranking],
+    }
+    fileutil.write_atomic(path, json.dumps(data, ensure_ascii=False, indent=1))
+
+
+def runner_factors(partials):
+    """每个分片的折算系数: 各参照 IP 的 (所有分片实测中位数 / 本分片实测) 取中位数; 没测到参照的记 1"""
+    speeds = {}
+    for partial in partials:
+        for key, mbps in partial['references'].items():
+            speeds.setdefault(key, []).append(mbps)
+    medians = {key: statistics.median(values) for key, values in speeds.items()}
+    factors = []
+    for partial in partials:
+        ratios = [medians[key] / mbps for key, mbps in partial['references'].items() if mbps > 0]
+        factors.append(statistics.median(ratios) if ratios else 1.0)
+    return factors
+
+
+def merge(paths):
+    """合并分片文件, 返回按折算后得分的 [SpeedResult] (顺序不定); 同一 IP:端口 出现在多个分片时得分取均值、样本数相加"""
+    partials = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            partials.append(json.load(f))
+    combined = {}
+    for partial, factor in zip(partials, runner_factors(partials)):
+        print(f"分片 {partial['shard']} ({partial['runner']}): {len(partial['results'])} 个结果, 折算系数 {factor:.2f}")
+        for item in partial['results']:
+            r = speed_results.SpeedResult(**item)
+            entry = combined.get(r.target)
+            if entry is None:
+                entry = combined[r.target] = {'result': replace(r, samples=0), 'scores': []}
+            entry['scores'].append(r.mbps * factor)
+            entry['result'].samples += r.samples
+            entry['result'].label = entry['result'].label or r.label
+            if entry['result'].rtt_ms is None:
+                entry['result'].rtt_ms = r.rtt_ms
+    return [replace(e['result'], mbps=statistics.fmean(e['scores'])) for e in combined.values()]